@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+"""startup benchmark: times how long each bad-utilities subcommand takes to
+print its help, which is mostly interpreter startup and imports
+
+Copyright 2023 Frank Yelland
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+# the repository root, where 'python -m utilities' finds the package
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# name: command line, run with the current interpreter
+commands = {
+    "python": ["-c", "pass"],
+    "bad-utilities": ["-m", "utilities", "--help"],
+    "corrupter": ["-m", "utilities", "corrupter", "--help"],
+    "frequency-analyser": ["-m", "utilities", "frequency-analyser", "--help"],
+    "webp-find-and-destroy": ["-m", "utilities", "webp-find-and-destroy",
+                              "--help"],
+}
+
+
+def time_command(arguments: list, runs: int) -> list:
+    """runs a command repeatedly and times each run
+    arguments:
+        arguments: list; arguments to the python interpreter
+        runs: int; number of timed runs
+    returns:
+        times: list; wall time of each run in seconds"""
+    # cached bytecode is what users get after the first run
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    command = [sys.executable, *arguments]
+
+    # the first run writes the bytecode cache and warms the disk cache
+    subprocess.run(command, cwd=root, env=env, stdout=subprocess.DEVNULL,
+                   check=True)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=root, env=env, stdout=subprocess.DEVNULL,
+                       check=True)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def main():
+    """main function"""
+    parser = argparse.ArgumentParser(description="times the startup of every\
+                                     bad-utilities subcommand by running it\
+                                     with --help")
+    parser.add_argument("-n",
+                        "--runs",
+                        action="store",
+                        type=int,
+                        default=20,
+                        metavar=" ",
+                        help="number of timed runs of each command"
+                        )
+    args = parser.parse_args()
+
+    print(f"{'command':<24}{'min ms':>10}{'median ms':>12}{'over python':>14}")
+    baseline = None
+    for name, arguments in commands.items():
+        times = time_command(arguments, args.runs)
+        median = statistics.median(times) * 1000
+        if baseline is None:
+            baseline = median
+        print(f"{name:<24}{min(times) * 1000:>10.1f}{median:>12.1f}\
+{median - baseline:>+14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""runs the bad-utilities command line, for 'python -m bad_utilities'"""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+"""cli - single entry point for the utilities, dispatching to each tool's
+main function. the tools are only imported once picked, so one tool's
+imports don't slow down starting another
+
+Copyright 2023 Frank Yelland
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+
+import sys
+import argparse
+import importlib
+
+# subcommand: (module, description)
+tools = {
+    "corrupter": ("corrupter", "corrupts files by flipping random bits"),
+    "frequency-analyser": ("frequency_analyser",
+                           "prints the frequency of characters in a text"),
+    "webp-find-and-destroy": ("webp_find_and_destroy",
+                              "converts webp files and deletes the webps"),
+}
+
+
+def main(argv: list = None) -> None:
+    """main function
+    optional arguments:
+        argv: list; command line arguments, defaults to sys.argv"""
+    parser = argparse.ArgumentParser(prog="bad-utilities", description="a\
+                                     collection of miscellaneous utilities.\
+                                     run 'bad-utilities <tool> --help' for\
+                                     the options of a tool")
+    parser.add_argument("tool", choices=tools.keys(), metavar="tool",
+                        help=", ".join(f"{name}: {description}" for
+                                       name, (_, description) in
+                                       tools.items()))
+    parser.add_argument("args", nargs=argparse.REMAINDER,
+                        help="arguments for the tool")
+    args = parser.parse_args(argv)
+
+    module_name = tools[args.tool][0]
+    # relative to the package when installed, or next to this file when
+    # run as a script
+    if __package__:
+        module = importlib.import_module(f".{module_name}", __package__)
+    else:
+        module = importlib.import_module(module_name)
+    module.main(args.args, prog=f"{parser.prog} {args.tool}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -21,6 +21,11 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
+import os
+import sys
+import time
+import atexit
+
 _ansi_commands = {
     "reset_style": "\x1b[0m",
     "bold": "\x1b[1m",
@@ -43,14 +48,367 @@ _ansi_commands = {
 }
 
 
+class Reporter:
+    """buffered message and progress printing shared by the utilities.
+    escape codes are worked out once, and when the stream isn't a terminal
+    colours and progress redraws are left out and writes are batched
+    arguments:
+        stream: text file object to write to, defaults to stdout
+    kwargs:
+        json: bool; write every message and result as a compact json object
+              per line instead of human readable text
+        colour: bool; force colours on or off, defaults to whether the
+                stream is a terminal
+        flush_interval: float; longest time in seconds to hold batched
+                        writes when not writing to a terminal
+        progress_interval: float; shortest time in seconds between
+                           progress redraws"""
+
+    # tag and colour of each message level
+    _levels = {
+        "info": ("[INFO]: ", 27),
+        "warning": ("[WARNING]: ", 220),
+        "error": ("[ERROR]: ", 196),
+    }
+
+    def __init__(self, stream=None, **kwargs):
+        self.stream = stream if stream is not None else sys.stdout
+        try:
+            self.tty = self.stream.isatty()
+        except (AttributeError, ValueError):
+            self.tty = False
+        self.json = kwargs.get("json", False)
+        self.colour = kwargs.get("colour", self.tty) and not self.json
+        self.flush_interval = kwargs.get("flush_interval", 0.5)
+        self.progress_interval = kwargs.get("progress_interval", 0.05)
+
+        if self.colour:
+            _enable_windows_ansi()
+        self._starts = {level: (colour(colour_id) if self.colour else "") + tag
+                        for level, (tag, colour_id) in self._levels.items()}
+        self._reset = colour(-1) if self.colour else ""
+        self._clear = f"\r{_ansi_commands['clear_line']}"
+
+        self._buffer: list = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._last_progress = 0.0
+        self._progress_shown = False
+        if self.json:
+            import json
+            self._dumps = json.JSONEncoder(separators=(",", ":"),
+                                           ensure_ascii=False).encode
+        atexit.register(self.flush)
+
+    def write(self, text: str) -> None:
+        """writes raw text, clearing the progress line first if one is shown
+        arguments:
+            text: str; text to write"""
+        if self._progress_shown:
+            text = self._clear + text
+            self._progress_shown = False
+        self._buffer.append(text)
+        self._buffered += len(text)
+
+        # a person is reading a terminal, so it is written straight away
+        if self.tty or self._buffered >= 65536 or \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def line(self, text: str = "") -> None:
+        """writes a line of human readable text, left out in json mode
+        arguments:
+            text: str; text to write"""
+        if not self.json:
+            self.write(f"{text}\n")
+
+    def message(self, level: str, *strings: str, **kwargs) -> None:
+        """writes messages tagged with their level
+        arguments:
+            level: str; 'info', 'warning' or 'error'
+            *strings: str; messages to write
+        kwargs:
+            line_end: str; line ending to use
+            prefix: str; text to put before the tag, e.g. a progress count"""
+        if self.json:
+            for string in strings:
+                self.record(level, message=string)
+            return
+
+        line_end = kwargs.get("line_end", "\n")
+        prefix = kwargs.get("prefix", "")
+        start = self._starts[level]
+        for string in strings:
+            self.write(f"{prefix}{start}{string}{self._reset}{line_end}")
+
+    def info(self, *strings: str, **kwargs) -> None:
+        """writes informational messages, see message"""
+        self.message("info", *strings, **kwargs)
+
+    def warning(self, *strings: str, **kwargs) -> None:
+        """writes warning messages, see message"""
+        self.message("warning", *strings, **kwargs)
+
+    def error(self, *strings: str, **kwargs) -> None:
+        """writes error messages, see message"""
+        self.message("error", *strings, **kwargs)
+
+    def record(self, event: str, **fields) -> None:
+        """writes a machine readable record, only in json mode
+        arguments:
+            event: str; kind of record, e.g. 'converted' or 'error'
+        kwargs:
+            fields of the record, anything json can encode"""
+        if self.json:
+            self.write(f"{self._dumps({'event': event, **fields})}\n")
+
+    def progress(self, text: str, force: bool = False) -> None:
+        """redraws the progress line. only drawn on terminals, and skipped
+        if the last redraw was too recent unless forced
+        arguments:
+            text: str; progress text
+        optional arguments:
+            force: bool; redraw regardless of the time since the last one"""
+        if not self.tty or self.json:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.progress_interval:
+            return
+        self._last_progress = now
+        self._buffer.append(f"{self._clear}{text}")
+        self._progress_shown = True
+        self.flush()
+
+    def end_progress(self) -> None:
+        """clears the progress line if one is shown"""
+        if self._progress_shown:
+            self._buffer.append(self._clear)
+            self._progress_shown = False
+            self.flush()
+
+    def flush(self) -> None:
+        """writes out everything batched so far"""
+        if self._buffer:
+            self.stream.write("".join(self._buffer))
+            self._buffer.clear()
+            self._buffered = 0
+        self.stream.flush()
+        self._last_flush = time.monotonic()
+
+
+class Profiler:
+    """collects the wall time, cpu time, bytes processed and peak memory of
+    each stage of a tool. stages are timed with
+    'with profiler.stage(name, size):', and a disabled profiler hands out one
+    shared stage that does nothing, so leaving profiling off costs a method
+    call per stage
+    kwargs:
+        enabled: bool; whether to time stages
+        dump: str | None; path to write cprofile stats of the run to"""
+
+    def __init__(self, **kwargs):
+        self.enabled = kwargs.get("enabled", False)
+        self.dump = kwargs.get("dump", None)
+        # name: [calls, wall time, cpu time, bytes, most a single call raised
+        #        the peak rss by]
+        self.stages: dict = {}
+        self._start = (time.perf_counter(), time.process_time())
+        self._profile = None
+        if self.dump:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stage(self, name: str, size: int = 0):
+        """times a stage, use as a context manager
+        arguments:
+            name: str; stage name, repeated stages are added together
+        optional arguments:
+            size: int; bytes processed, more can be added with the add
+                  method of the returned stage
+        returns:
+            stage: context manager"""
+        if not self.enabled:
+            return _null_stage
+        return _Stage(self, name, size)
+
+    def collect(self) -> dict:
+        """hands over the stages timed so far and starts again, for sending
+        timings from worker processes
+        returns:
+            stages: dict; stages in the format of Profiler.stages"""
+        stages = self.stages
+        self.stages = {}
+        return stages
+
+    def merge(self, stages: dict) -> None:
+        """adds stages timed by another profiler, e.g. in a worker process
+        arguments:
+            stages: dict; stages from Profiler.collect"""
+        for name, (calls, wall, cpu, size, rss) in stages.items():
+            totals = self.stages.setdefault(name, [0, 0.0, 0.0, 0, None])
+            totals[0] += calls
+            totals[1] += wall
+            totals[2] += cpu
+            totals[3] += size
+            if rss is not None:
+                totals[4] = max(totals[4] or 0, rss)
+
+    def report(self) -> None:
+        """writes the stage summary through the reporter, as a table or a
+        json record, and dumps the cprofile stats if asked to"""
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.dump)
+        if not self.enabled:
+            return
+
+        wall = time.perf_counter() - self._start[0]
+        cpu = time.process_time() - self._start[1]
+        # only this process, the workers' own peaks show as their stages'
+        # increases
+        peak = _peak_rss()
+        reporter.record("profile", wall=wall, cpu=cpu, peak_rss=peak,
+                        stages={name: {"calls": calls, "wall": stage_wall,
+                                       "cpu": stage_cpu, "bytes": size,
+                                       "peak_rss_increase": rss}
+                                for name, (calls, stage_wall, stage_cpu,
+                                           size, rss)
+                                in self.stages.items()})
+
+        # stages run by parallel workers add up to more than the total
+        reporter.line(f"{'stage':<10}{'calls':>8}{'wall s':>10}{'cpu s':>10}\
+{'MiB':>10}{'MiB/s':>10}{'peak +MiB':>11}")
+        for name, (calls, stage_wall, stage_cpu, size, rss) in \
+                self.stages.items():
+            rate = size / stage_wall / 1048576 if stage_wall > 0 else 0.0
+            reporter.line(f"{name:<10}{calls:>8}{stage_wall:>10.3f}\
+{stage_cpu:>10.3f}{size / 1048576:>10.1f}{rate:>10.1f}\
+{_format_rss(rss):>11}")
+        # the total column is the peak itself rather than an increase
+        reporter.line(f"{'total':<10}{'':>8}{wall:>10.3f}{cpu:>10.3f}\
+{'':>10}{'':>10}{_format_rss(peak):>11}")
+
+
+class _Stage:
+    """a stage being timed, see Profiler.stage"""
+
+    __slots__ = ("profiler", "name", "size", "_wall", "_cpu", "_rss")
+
+    def __init__(self, profiler: Profiler, name: str, size: int):
+        self.profiler = profiler
+        self.name = name
+        self.size = size
+
+    def __enter__(self):
+        self._rss = _peak_rss()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        cpu = time.process_time() - self._cpu
+        totals = self.profiler.stages.setdefault(self.name,
+                                                 [0, 0.0, 0.0, 0, None])
+        totals[0] += 1
+        totals[1] += wall
+        totals[2] += cpu
+        totals[3] += self.size
+        # the peak only ever grows, so how much it grew during the stage is
+        # the memory the stage needed on top of what was already used
+        if self._rss is not None:
+            raised = _peak_rss() - self._rss
+            totals[4] = max(totals[4] or 0, raised)
+        return False
+
+    def add(self, size: int) -> None:
+        """adds to the bytes processed by the stage
+        arguments:
+            size: int; number of bytes"""
+        self.size += size
+
+
+class _NullStage:
+    """stage handed out by a disabled profiler, does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def add(self, size: int) -> None:
+        """does nothing, see _Stage.add"""
+
+
+_null_stage = _NullStage()
+
+
+def _peak_rss() -> int:
+    """gets the peak resident memory of this process
+    returns:
+        peak: int | None; bytes, or None where it can't be measured
+              (windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macos reports bytes, everything else kibibytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_rss(rss: int) -> str:
+    """formats a peak rss or increase in mebibytes for the profile table
+    arguments:
+        rss: int | None; bytes
+    returns:
+        rss_string: str; mebibytes, or '-' if unknown"""
+    return "-" if rss is None else f"{rss / 1048576:.1f}"
+
+
+def add_profile_arguments(parser) -> None:
+    """adds the --profile and --profile-dump options to a tool's parser
+    arguments:
+        parser: argparse.ArgumentParser; parser to add to"""
+    parser.add_argument("--profile", action="store_true", default=False,
+                        help="print the wall time, cpu time, bytes processed\
+                        and peak memory of each stage when done")
+    parser.add_argument("--profile-dump", action="store", metavar=" ",
+                        default=None, help="write cprofile stats of the run\
+                        to this file, for pstats or snakeviz")
+
+
+def start_profiling(args) -> None:
+    """swaps in an enabled profiler if the profiling options are set
+    arguments:
+        args: argparse.Namespace; parsed arguments, see
+              add_profile_arguments"""
+    global profiler
+    if args.profile or args.profile_dump:
+        profiler = Profiler(enabled=args.profile, dump=args.profile_dump)
+
+
+def _enable_windows_ansi() -> None:
+    """turns on ansi escape codes in the windows console"""
+    # code copied from stackoverflow
+    # fixes cmd being a bitch about ansi colour codes
+    if os.name == 'nt':
+        from ctypes import windll
+        kernel = windll.kernel32
+        kernel.SetConsoleMode(kernel.GetStdHandle(-11), 7)
+
+
 def print_warning(*strings: str, line_end: str = "\n"):
     """prints a warning message to the console
     arguments:
         *strings: str; warnings to print
     optional arguments:
         line_end; str, line ending to use"""
-    for string in strings:
-        print(f"{colour(220)}[WARNING]: {string}{colour(-1)}", end=line_end)
+    reporter.warning(*strings, line_end=line_end)
 
 
 def print_error(*strings: str, line_end: str = "\n"):
@@ -59,8 +417,7 @@ def print_error(*strings: str, line_end: str = "\n"):
         *strings: str; warnings to print
     optional arguments:
         line_end; str, line ending to use"""
-    for string in strings:
-        print(f"{colour(196)}[ERROR]: {string}{colour(-1)}", end=line_end)
+    reporter.error(*strings, line_end=line_end)
 
 
 def print_info(*strings: str, line_end: str = "\n"):
@@ -69,8 +426,7 @@ def print_info(*strings: str, line_end: str = "\n"):
         *strings: str; warnings to print
     optional arguments:
         line_end; str, line ending to use"""
-    for string in strings:
-        print(f"{colour(27)}[INFO]: {string}{colour(-1)}", end=line_end)
+    reporter.info(*strings, line_end=line_end)
 
 
 def colour(colour_id: int, background: bool = False) -> str:
@@ -103,3 +459,10 @@ def cmd(command: str, *args) -> str:
         return _ansi_commands[command].format(*args)
     else:
         return ""
+
+
+# the reporter used by the print functions, tools that write data to stdout
+# can swap it for one on stderr
+reporter = Reporter()
+# the profiler tools time their stages with, disabled unless --profile is set
+profiler = Profiler()
@@ -23,10 +23,67 @@ THE SOFTWARE.
 """
 
 import os
+import sys
+import math
+import mmap
+import stat
+import time
 import random
 import argparse
 import errno
-import common
+import itertools
+
+# works both as part of the bad_utilities package and as a script
+try:
+    from . import common
+    from . import regions
+except ImportError:
+    import common
+    import regions
+
+
+def _flip(buffer: bytearray, start: int, end: int) -> None:
+    """flips a single random bit at start"""
+    buffer[start] ^= 1 << random.randint(0, 7)
+
+
+def _burst(buffer: bytearray, start: int, end: int) -> None:
+    """flips random bits all over a run of bytes"""
+    length = end - start
+    noise = int.from_bytes(random.randbytes(length), "little")
+    run = int.from_bytes(buffer[start:end], "little")
+    buffer[start:end] = (run ^ noise).to_bytes(length, "little")
+
+
+def _zero(buffer: bytearray, start: int, end: int) -> None:
+    """zeroes a run of bytes, like a dropped sector"""
+    buffer[start:end] = bytes(end - start)
+
+
+def _random_fill(buffer: bytearray, start: int, end: int) -> None:
+    """overwrites a run of bytes with random garbage"""
+    buffer[start:end] = random.randbytes(end - start)
+
+
+def _shift(buffer: bytearray, start: int, end: int) -> None:
+    """rotates a run of bytes by a random amount, like a block written
+    slightly out of place"""
+    if end - start < 2:
+        return
+    amount = random.randint(1, end - start - 1)
+    buffer[start:end] = buffer[start + amount:end] + \
+        buffer[start:start + amount]
+
+
+# every mode works on a whole (start, end) run at once with slice operations
+# so heavy damage doesn't mean a python loop over every byte
+corruption_modes = {
+    "flip": _flip,
+    "burst": _burst,
+    "zero": _zero,
+    "random": _random_fill,
+    "shift": _shift,
+}
 
 
 def corrupt_file(number_of_corruptions: int, file_path: str, **kwargs) -> None:
@@ -38,8 +95,23 @@ def corrupt_file(number_of_corruptions: int, file_path: str, **kwargs) -> None:
         head: int; number of bytes in header to protect
         tail: int; number of bytes in tailer to protect
         verbose: bool; print progress info
+        stream: bool; corrupt the file in a single pass with bounded memory
+                instead of reading all of it
+        file_format: str | None; container format to target regions of, or
+                     'auto' to detect it. None corrupts anywhere between
+                     head and tail
+        include: list; glob patterns of region names to target
+        exclude: list; glob patterns of region names to avoid
+        mode: str; corruption mode, one of corruption_modes
+        length: int; number of bytes each corruption covers, ignored by the
+                flip mode
+        rate: float | None; corruptions per byte, overrides
+              number_of_corruptions
     returns:
-        None"""
+        None
+    raises:
+        ValueError: if the head and tail protection leave nothing to
+                    corrupt"""
 
     # optional header size
     head_size = 100
@@ -57,64 +129,592 @@ def corrupt_file(number_of_corruptions: int, file_path: str, **kwargs) -> None:
     full_file_name = os.path.basename(file_path)
     file_name, file_extension = os.path.splitext(full_file_name)
 
-    if verbose:
-        print(f"reading {full_file_name}...", end="")
-
     # removing previous run
     try:
         os.remove(f"{file_name}_corrupted{file_extension}")
     except OSError:
         pass
 
+    if kwargs.get("stream", False):
+        if verbose:
+            common.reporter.write(f"streaming {full_file_name}...")
+        try:
+            with open(file_path, "rb") as in_file:
+                size = os.fstat(in_file.fileno()).st_size
+                eligible = None
+                if kwargs.get("file_format") and size > 0:
+                    # mapping the file lets the index be built without
+                    # reading it all into memory
+                    with mmap.mmap(in_file.fileno(), 0,
+                                   access=mmap.ACCESS_READ) as data:
+                        eligible = _eligible_regions(data, size, head_size,
+                                                     tail_size, **kwargs)
+                if kwargs.get("file_format") and not eligible:
+                    common.print_error(f"{file_path}: no eligible regions to\
+ corrupt")
+                    return None
+                out_path = f"{file_name}_corrupted{file_extension}"
+                try:
+                    with open(out_path, "wb") as out_file:
+                        applied = corrupt_stream(
+                            number_of_corruptions, in_file, out_file,
+                            size=size, head=head_size, tail=tail_size,
+                            regions=eligible, mode=kwargs.get("mode", "flip"),
+                            length=kwargs.get("length", 1),
+                            rate=kwargs.get("rate"))
+                except ValueError:
+                    # not leaving an empty output behind
+                    os.remove(out_path)
+                    raise
+        except OSError as err:
+            _print_os_error(err, file_path)
+            if verbose:
+                common.reporter.line("done")
+            return None
+        if verbose:
+            common.reporter.line("done")
+        common.reporter.record("corrupted", input=file_path,
+                               output=f"{file_name}_corrupted{file_extension}",
+                               size=size, corruptions=applied,
+                               mode=kwargs.get("mode", "flip"))
+        return None
+
+    if verbose:
+        common.reporter.write(f"reading {full_file_name}...")
+
     # reading content to array: with error handling for file read errors
     try:
-        with open(file_path, "rb+") as file:
+        with open(file_path, "rb+") as file, \
+                common.profiler.stage("read") as stage:
             file_content = file.read()
+            stage.add(len(file_content))
     except OSError as err:
-        if err.errno == errno.EACCES:
-            common.print_error(f"{file_path}: access denied")
-        elif err.errno == errno.EISDIR:
-            print(f"[ERROR]: {file_path} is a directory")
-        elif err.errno == errno.ENOENT:
-            print(f"[ERROR]: {file_path} not found")
-        else:
-            print(f"[ERROR]: OSError: {err}: {file_path}")
+        _print_os_error(err, file_path)
         if verbose:
-            print("done")
+            common.reporter.line("done")
         return None
 
-    # converting file from bytes (immutable) to list of ints (mutable)
-    content = [byte for byte in file_content]
-
     if verbose:
-        print(f"done\ncorrupting {full_file_name}...", end="")
+        common.reporter.write(f"done\ncorrupting {full_file_name}...")
 
-    # flipping random bits
-    size = os.path.getsize(file_path)
-    for _ in range(number_of_corruptions):
-        try:
-            index = random.randint(head_size, size - 1 - tail_size)
-        except ValueError:
-            print("[ERROR]: head and tail protection overlap")
-            exit(1)
+    eligible = None
+    if kwargs.get("file_format"):
+        eligible = _eligible_regions(file_content, len(file_content),
+                                     head_size, tail_size, **kwargs)
+        if not eligible:
+            common.print_error(f"{file_path}: no eligible regions to corrupt")
+            return None
 
-        content[index] = content[index] ^ (1 << random.randint(0, 7))
+    content, spans = corrupt_bytes(number_of_corruptions, file_content,
+                                   head=head_size, tail=tail_size,
+                                   regions=eligible,
+                                   mode=kwargs.get("mode", "flip"),
+                                   length=kwargs.get("length", 1),
+                                   rate=kwargs.get("rate"))
 
     if verbose:
-        print(f"done\nwriting {file_name}_corrupted{file_extension}...",
-              end="")
+        common.reporter.write(
+            f"done\nwriting {file_name}_corrupted{file_extension}...")
 
     # writing array to file
-    file_content = bytes(content)
-
-    with open(f"{file_name}_corrupted{file_extension}", "wb+") as file:
-        file.write(file_content)
+    with open(f"{file_name}_corrupted{file_extension}", "wb+") as file, \
+            common.profiler.stage("write", len(content)):
+        file.write(content)
 
     if verbose:
-        print("done")
+        common.reporter.line("done")
+    common.reporter.record("corrupted", input=file_path,
+                           output=f"{file_name}_corrupted{file_extension}",
+                           size=len(content), corruptions=len(spans),
+                           mode=kwargs.get("mode", "flip"))
 
 
-if __name__ == "__main__":
+def corrupt_bytes(number_of_corruptions: int, file_content: bytes,
+                  **kwargs) -> tuple:
+    """corrupt_bytes: corrupts a copy of some data in memory
+    args:
+        number_of_corruptions: int; number of corruptions
+        file_content: bytes; data to corrupt
+    kwargs:
+        head: int; number of bytes in header to protect
+        tail: int; number of bytes in tailer to protect
+        regions: list | None; eligible (start, end, name) regions
+        mode: str; corruption mode, one of corruption_modes
+        length: int; number of bytes each corruption covers
+        rate: float | None; corruptions per byte, overrides
+              number_of_corruptions
+    returns:
+        content: bytearray; corrupted data
+        spans: list; (start, end) runs that were corrupted, in order
+    raises:
+        ValueError: if the head and tail protection leave nothing to
+                    corrupt"""
+    # converting file from bytes (immutable) to a bytearray (mutable)
+    with common.profiler.stage("convert", len(file_content)):
+        content = bytearray(file_content)
+
+    with common.profiler.stage("corrupt") as stage:
+        spans = _draw_spans(number_of_corruptions, len(content),
+                            kwargs.get("head", 100), kwargs.get("tail", 0),
+                            regions=kwargs.get("regions"),
+                            mode=kwargs.get("mode", "flip"),
+                            length=kwargs.get("length", 1),
+                            rate=kwargs.get("rate"))
+
+        corruption = corruption_modes[kwargs.get("mode", "flip")]
+        for start, end in spans:
+            corruption(content, start, end)
+            stage.add(end - start)
+
+    return content, spans
+
+
+def corrupt_stream(number_of_corruptions: int, in_file, out_file,
+                   **kwargs) -> int:
+    """corrupt_stream: corrupts a binary stream chunk by chunk, so it works
+    in pipes and on files larger than memory
+    args:
+        number_of_corruptions: int; number of corruptions, used when the
+                               length of the stream is known
+        in_file: binary file object to read from
+        out_file: binary file object to write to
+    kwargs:
+        size: int | None; length of the stream in bytes, or None if unknown
+        rate: float | None; corruptions per byte. required when the length
+              of the stream is unknown, overrides number_of_corruptions
+              otherwise
+        head: int; number of bytes in header to protect
+        tail: int; number of bytes in tailer to protect
+        regions: list | None; (start, end, name) regions to pick positions
+                 from, used when the length of the stream is known
+        mode: str; corruption mode, one of corruption_modes
+        length: int; number of bytes each corruption covers
+        chunk_size: int; number of bytes to read at a time
+    returns:
+        applied: int; number of corruptions made
+    raises:
+        ValueError: if the head and tail protection leave nothing to
+                    corrupt"""
+    head_size = kwargs.get("head", 100)
+    tail_size = kwargs.get("tail", 0)
+    size = kwargs.get("size", None)
+    chunk_size = kwargs.get("chunk_size", 1048576)
+    corruption = corruption_modes[kwargs.get("mode", "flip")]
+    length = _run_length(**kwargs)
+
+    # the corruptions are drawn up front in ascending order, so every
+    # chunk only has to look at the front of the queue
+    if size is not None:
+        spans = iter(sorted(_draw_spans(
+            number_of_corruptions, size, head_size, tail_size,
+            regions=kwargs.get("regions"), mode=kwargs.get("mode", "flip"),
+            length=kwargs.get("length", 1), rate=kwargs.get("rate"))))
+        # nothing to hold back as the spans already avoid the tail
+        hold = 0
+    else:
+        spans = ((position, position + length) for position in
+                 _rate_positions(head_size, kwargs.get("rate") or 0.0))
+        # the tail can't be known until the end of the stream, so the last
+        # tail_size bytes are held back until more data arrives
+        hold = tail_size
+
+    span = next(spans, None)
+    applied = 0
+    pending = bytearray()
+    # stream offset of pending[0]
+    offset = 0
+
+    while True:
+        with common.profiler.stage("read") as stage:
+            chunk = in_file.read(chunk_size)
+            stage.add(len(chunk))
+        pending += chunk
+        limit = max(len(pending) - hold, 0)
+
+        with common.profiler.stage("corrupt") as stage:
+            while span is not None and span[0] - offset < limit:
+                start, end = span[0] - offset, span[1] - offset
+                # spans running past the data read so far wait for the next
+                # chunk, unless there isn't one
+                if end > limit and chunk:
+                    break
+                corruption(pending, start, min(end, limit))
+                stage.add(min(end, limit) - start)
+                applied += 1
+                span = next(spans, None)
+
+        if not chunk:
+            with common.profiler.stage("write", len(pending)):
+                out_file.write(pending)
+            break
+
+        # everything before the next span is final
+        flush = limit if span is None else min(limit, span[0] - offset)
+        with common.profiler.stage("write", flush):
+            out_file.write(pending[:flush])
+        del pending[:flush]
+        offset += flush
+
+    out_file.flush()
+    return applied
+
+
+def _draw_spans(number_of_corruptions: int, size: int, head_size: int,
+                tail_size: int, **kwargs) -> list:
+    """draws the (start, end) runs to corrupt in a file of known size
+    arguments:
+        number_of_corruptions: int; number of corruptions
+        size: int; file size
+        head_size: int; number of bytes in header to protect
+        tail_size: int; number of bytes in tailer to protect
+    kwargs:
+        regions: list | None; eligible (start, end, name) regions
+        mode: str; corruption mode
+        length: int; number of bytes each corruption covers
+        rate: float | None; corruptions per byte, overrides
+              number_of_corruptions
+    returns:
+        spans: list; (start, end) tuples in the order they were drawn
+    raises:
+        ValueError: if the head and tail protection leave nothing to
+                    corrupt"""
+    length = _run_length(**kwargs)
+    if kwargs.get("rate") is not None:
+        number_of_corruptions = round(kwargs["rate"] * size)
+
+    if kwargs.get("regions"):
+        return regions.sample_spans(kwargs["regions"], number_of_corruptions,
+                                    length)
+
+    if head_size > size - 1 - tail_size:
+        raise ValueError("head and tail protection overlap")
+
+    spans = []
+    for _ in range(number_of_corruptions):
+        start = random.randint(head_size, size - 1 - tail_size)
+        spans.append((start, min(start + length, size - tail_size)))
+
+    return spans
+
+
+def _run_length(**kwargs) -> int:
+    """gets the number of bytes each corruption covers
+    kwargs:
+        mode: str; corruption mode
+        length: int; requested run length
+    returns:
+        length: int; run length, always 1 for bit flips"""
+    if kwargs.get("mode", "flip") == "flip":
+        return 1
+    return max(kwargs.get("length", 1), 1)
+
+
+def _eligible_regions(data, size: int, head_size: int, tail_size: int,
+                      **kwargs) -> list:
+    """builds the region index of a file and filters it to the regions that
+    can be corrupted
+    arguments:
+        data: bytes-like; file content
+        size: int; file size
+        head_size: int; number of bytes in header to protect
+        tail_size: int; number of bytes in tailer to protect
+    kwargs:
+        file_format: str; format name or 'auto'
+        include: list; glob patterns of region names to target
+        exclude: list; glob patterns of region names to avoid
+    returns:
+        eligible: list; (start, end, name) regions"""
+    index = regions.build_index(data, kwargs["file_format"])
+    return regions.select_regions(index, include=kwargs.get("include"),
+                                  exclude=kwargs.get("exclude"),
+                                  low=head_size, high=size - tail_size)
+
+
+def _rate_positions(start: int, rate: float):
+    """yields ascending positions from start onwards, each byte being picked
+    with a chance of rate. the gaps are drawn from a geometric distribution
+    so untouched bytes cost nothing
+    arguments:
+        start: int; first position that can be picked
+        rate: float; chance of each byte being picked
+    yields:
+        position: int; picked stream position"""
+    if rate <= 0:
+        return
+    if rate >= 1:
+        yield from itertools.count(start)
+        return
+
+    log_miss = math.log1p(-rate)
+    position = start - 1
+    while True:
+        position += 1 + int(math.log(1.0 - random.random()) / log_miss)
+        yield position
+
+
+def _print_os_error(err: OSError, file_path: str) -> None:
+    """prints a file read error in a readable way
+    arguments:
+        err: OSError; error raised
+        file_path: str; path to the file"""
+    if err.errno == errno.EACCES:
+        common.print_error(f"{file_path}: access denied")
+    elif err.errno == errno.EISDIR:
+        common.print_error(f"{file_path} is a directory")
+    elif err.errno == errno.ENOENT:
+        common.print_error(f"{file_path} not found")
+    else:
+        common.print_error(f"OSError: {err}: {file_path}")
+
+
+def fuzz(number_of_corruptions: int, file_path: str, command: str,
+         **kwargs) -> None:
+    """fuzz: keeps corrupting a file and running a command on each variant
+    in parallel, saving a patch log for every variant that crashes it
+    args:
+        number_of_corruptions: int; number of corruptions per variant
+        file_path: str; path to the file to corrupt
+        command: str; command to run, '@@' is replaced by the path of the
+                 variant, and the variant is piped to stdin if there is no
+                 '@@'
+    kwargs:
+        jobs: int; number of parallel workers
+        iterations: int; number of variants to try, 0 runs until interrupted
+        timeout: float; seconds before a run counts as a hang
+        crash_dir: str; directory to save crash logs in
+        crash_codes: list; exit codes that count as crashes on top of being
+                     killed by a signal
+        seed: int | None; first seed, variants use consecutive seeds
+        verbose: bool; print throughput while running
+        plus the head, tail, file_format, include, exclude, mode, length and
+        rate kwargs of corrupt_file
+    returns:
+        None
+    raises:
+        ValueError: if the head and tail protection leave nothing to
+                    corrupt"""
+    # only fuzzing needs these, so plain corrupting starts faster
+    import shlex
+    import shutil
+    import tempfile
+    import concurrent.futures
+
+    jobs = kwargs.get("jobs", None) or os.cpu_count() or 1
+    iterations = kwargs.get("iterations", 0)
+    crash_dir = kwargs.get("crash_dir", "crashes")
+    seed = kwargs.get("seed", None)
+    verbose = kwargs.get("verbose", True)
+    if seed is None:
+        seed = random.getrandbits(32)
+
+    try:
+        with open(file_path, "rb") as file:
+            file_content = file.read()
+    except OSError as err:
+        _print_os_error(err, file_path)
+        return None
+
+    head_size = kwargs.get("head", 100)
+    tail_size = kwargs.get("tail", 0)
+    eligible = None
+    if kwargs.get("file_format"):
+        eligible = _eligible_regions(file_content, len(file_content),
+                                     head_size, tail_size, **kwargs)
+        if not eligible:
+            common.print_error(f"{file_path}: no eligible regions to corrupt")
+            return None
+
+    # everything a worker needs, sent once when it starts instead of with
+    # every sample
+    settings = {
+        "corruptions": number_of_corruptions,
+        "head": head_size,
+        "tail": tail_size,
+        "regions": eligible,
+        "mode": kwargs.get("mode", "flip"),
+        "length": kwargs.get("length", 1),
+        "rate": kwargs.get("rate"),
+        "command": shlex.split(command),
+        "timeout": kwargs.get("timeout", 5.0),
+        "crash_codes": kwargs.get("crash_codes", None) or [],
+        "extension": os.path.splitext(file_path)[1],
+    }
+    # the settings are tried once here, as a bad head, tail or length would
+    # otherwise fail every sample the same way
+    _draw_spans(number_of_corruptions, len(file_content), head_size,
+                tail_size, regions=eligible, mode=settings["mode"],
+                length=settings["length"], rate=settings["rate"])
+    # and so would a missing program
+    if not settings["command"] or shutil.which(settings["command"][0]) is None:
+        common.print_error(f"command '{command}' not found")
+        return None
+    os.makedirs(crash_dir, exist_ok=True)
+
+    counts = {"samples": 0, "crash": 0, "hang": 0, "error": 0}
+    start_time = time.perf_counter()
+    seeds = itertools.count(seed) if iterations <= 0 else \
+        iter(range(seed, seed + iterations))
+
+    with tempfile.TemporaryDirectory(prefix="corrupter_") as sample_dir:
+        settings["sample_dir"] = sample_dir
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=jobs, initializer=_fuzz_init,
+                initargs=(file_content, settings)) as pool:
+            pending: dict = {}
+            try:
+                while True:
+                    # keeping a couple of samples queued per worker so none
+                    # of them sit idle
+                    for next_seed in itertools.islice(
+                            seeds, jobs * 2 - len(pending)):
+                        pending[pool.submit(_fuzz_sample, next_seed)] = \
+                            next_seed
+                    if not pending:
+                        break
+
+                    done, _ = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        sample_seed = pending.pop(future)
+                        counts["samples"] += 1
+                        try:
+                            result = future.result()
+                        # e.g. the sample couldn't be written, which only
+                        # loses that sample
+                        except Exception as err:
+                            counts["error"] += 1
+                            common.print_warning(f"sample with seed \
+{sample_seed} failed: {err}")
+                            continue
+                        if result["kind"] is not None:
+                            counts[result["kind"]] += 1
+                            _save_crash(result, file_path, command, crash_dir)
+
+                    # nothing working after a full round of samples means
+                    # every one will fail the same way
+                    if counts["error"] == counts["samples"] >= jobs * 2:
+                        common.print_error("every sample failed, stopping")
+                        break
+
+                    if verbose:
+                        common.reporter.progress(_fuzz_status(
+                            counts, time.perf_counter() - start_time))
+            except KeyboardInterrupt:
+                pool.shutdown(wait=True, cancel_futures=True)
+            # a worker died, so the pool can't run any more samples
+            except concurrent.futures.BrokenExecutor as err:
+                common.print_error(f"fuzzing stopped, a worker died: {err}")
+
+    elapsed = time.perf_counter() - start_time
+    common.reporter.end_progress()
+    if common.reporter.json:
+        common.reporter.record("fuzz", input=file_path, command=command,
+                               seed=seed, samples=counts["samples"],
+                               crashes=counts["crash"], hangs=counts["hang"],
+                               errors=counts["error"],
+                               seconds=round(elapsed, 3))
+    else:
+        common.print_info(_fuzz_status(counts, elapsed))
+
+
+def _fuzz_status(counts: dict, elapsed: float) -> str:
+    """formats the fuzzing throughput
+    arguments:
+        counts: dict; numbers of samples, crashes, hangs and errors
+        elapsed: float; seconds since fuzzing started
+    returns:
+        status: str; status line"""
+    rate = counts["samples"] / elapsed if elapsed > 0 else 0.0
+    errors = f", {counts['error']} errors" if counts.get("error") else ""
+    return f"{counts['samples']} samples, {counts['crash']} crashes, \
+{counts['hang']} hangs{errors}, {rate:.1f} samples/s"
+
+
+def _save_crash(result: dict, file_path: str, command: str,
+                crash_dir: str) -> None:
+    """writes the patch log of a crashing variant, which can be regenerated
+    by running the corrupter with the same options and --seed
+    arguments:
+        result: dict; result from _fuzz_sample
+        file_path: str; path to the original file
+        command: str; command that crashed
+        crash_dir: str; directory to save the log in"""
+    import json
+
+    log = {"input": file_path, "command": command, **result}
+    log_path = os.path.join(crash_dir,
+                            f"{result['kind']}_{result['seed']}.json")
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        json.dump(log, log_file, indent=4)
+    if common.reporter.json:
+        common.reporter.record(result["kind"], seed=result["seed"],
+                               returncode=result["returncode"], log=log_path)
+        return
+    reason = "timed out" if result["returncode"] is None else \
+        f"exit status {result['returncode']}"
+    common.print_warning(f"{result['kind']} with seed {result['seed']} \
+({reason}), saved to {log_path}")
+
+
+def _fuzz_init(file_content: bytes, settings: dict) -> None:
+    """stores the original file and settings in a fuzzing worker"""
+    global _fuzz_content, _fuzz_settings
+    # a forked worker would otherwise time stages nobody reports
+    common.profiler = common.Profiler()
+    _fuzz_content = file_content
+    _fuzz_settings = settings
+
+
+def _fuzz_sample(seed: int) -> dict:
+    """generates and runs a single variant in a fuzzing worker
+    arguments:
+        seed: int; seed for the variant
+    returns:
+        result: dict; seed, kind ('crash', 'hang' or None), exit status and
+                patch log of the variant"""
+    import subprocess
+
+    settings = _fuzz_settings
+    random.seed(seed)
+    content, spans = corrupt_bytes(settings["corruptions"],
+                                   _fuzz_content, **settings)
+
+    sample_path = os.path.join(settings["sample_dir"],
+                               f"{os.getpid()}{settings['extension']}")
+    command = [sample_path if arg == "@@" else arg
+               for arg in settings["command"]]
+    if "@@" in settings["command"]:
+        with open(sample_path, "wb") as sample:
+            sample.write(content)
+        stdin_content = None
+    else:
+        stdin_content = bytes(content)
+
+    kind = None
+    try:
+        returncode = subprocess.run(command, input=stdin_content,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.DEVNULL,
+                                    timeout=settings["timeout"],
+                                    check=False).returncode
+        # a negative code means the process was killed by a signal
+        if returncode < 0 or returncode in settings["crash_codes"]:
+            kind = "crash"
+    except subprocess.TimeoutExpired:
+        returncode = None
+        kind = "hang"
+
+    return {"seed": seed, "kind": kind, "returncode": returncode,
+            "mode": settings["mode"],
+            "spans": spans if kind is not None else None}
+
+
+def main(argv: list = None, prog: str = None) -> None:
+    """main function
+    optional arguments:
+        argv: list; command line arguments, defaults to sys.argv
+        prog: str; program name to show in the help"""
     size_dict = {
         "B": 1,
         "KB": 1000,
@@ -127,10 +727,10 @@ if __name__ == "__main__":
 
     # the horrible line breaking is to appease flake8
     # the \b and \033[A are hacks to make the help option look correct
-    parser = argparse.ArgumentParser(description="corrupts files: opens a set \
-                                     of specified files, flips various bits at\
-                                      random then saves them to\
-                                      <filename>_corrupted.<extension>")
+    parser = argparse.ArgumentParser(prog=prog, description="corrupts files:\
+                                     opens a set of specified files, flips\
+                                     various bits at random then saves them\
+                                     to <filename>_corrupted.<extension>")
     parser.add_argument("-c", "--corruptions", action="store", type=int,
                         metavar="\b", default=100, help="\033[Anumber of\
                         flipped bit corruptions. increase to worsen the\
@@ -146,26 +746,175 @@ if __name__ == "__main__":
     parser.add_argument("-u", "--unit", choices=size_dict.keys(), metavar="\b",
                         default="B", help=f"select unit for header and tailer\
                         options. options: {', '.join(size_dict.keys())}")
+    parser.add_argument("-s", "--stream", action="store_true", default=False,
+                        help="corrupt files in a single pass with bounded\
+                        memory, for files larger than ram")
+    parser.add_argument("-r", "--rate", action="store", type=float,
+                        metavar="\b", default=None, help="corruptions per MB.\
+                        overrides --corruptions, and is needed for streams of\
+                        unknown length such as pipes")
+    parser.add_argument("-m", "--mode", choices=corruption_modes.keys(),
+                        metavar="\b", default="flip", help=f"corruption mode.\
+                        flip flips single bits, the others damage --length\
+                        byte runs. options: {', '.join(corruption_modes)}")
+    parser.add_argument("-l", "--length", action="store", type=int,
+                        metavar="\b", default=512, help="number of bytes each\
+                        corruption covers in the burst, zero, random and shift\
+                        modes")
+    parser.add_argument("-f", "--format", metavar="\b", default=None,
+                        choices=["auto", *regions.parsers.keys()],
+                        help=f"only corrupt the payload chunks of a\
+                        container format. options: auto,\
+                        {', '.join(regions.parsers.keys())}")
+    parser.add_argument("--target", action="append", metavar="\b",
+                        default=None, help="region name pattern to corrupt,\
+                        e.g. IDAT, 'VP8*', '*/crc'. can be repeated. implies\
+                        --format auto. head and tail protection still apply")
+    parser.add_argument("--skip", action="append", metavar="\b",
+                        default=None, help="region name pattern to leave\
+                        alone. can be repeated. implies --format auto")
+    parser.add_argument("-S", "--seed", action="store", type=int, metavar="\b",
+                        default=None, help="random seed, to reproduce a run.\
+                        fuzzing crash logs can be replayed with their seed")
+    parser.add_argument("--fuzz", action="store", metavar="\b", default=None,
+                        help="keep corrupting the file and run this command on\
+                        every variant, '@@' is replaced with the variant's\
+                        path. without '@@' the variant is piped to stdin.\
+                        crashes and hangs are logged to --crash-dir")
+    parser.add_argument("-j", "--jobs", action="store", type=int, metavar="\b",
+                        default=None, help="number of parallel fuzzing\
+                        workers. defaults to the number of cpus")
+    parser.add_argument("--iterations", action="store", type=int,
+                        metavar="\b", default=0, help="number of variants to\
+                        fuzz with, 0 runs until interrupted")
+    parser.add_argument("--timeout", action="store", type=float, metavar="\b",
+                        default=5.0, help="seconds before a fuzzing run counts\
+                        as a hang")
+    parser.add_argument("--crash-dir", action="store", metavar="\b",
+                        default="crashes", help="directory to save crash logs\
+                        in")
+    parser.add_argument("--crash-code", action="append", type=int,
+                        metavar="\b", default=None, help="exit status that\
+                        counts as a crash on top of signals, e.g. 1 for\
+                        sanitizers. can be repeated")
+    parser.add_argument("--json", action="store_true", default=False,
+                        help="print one json object per corrupted file, crash\
+                        and fuzzing run instead of readable messages")
+    common.add_profile_arguments(parser)
     parser.add_argument('filepaths', nargs=argparse.REMAINDER,
-                        help="paths to files to corrupt")
+                        help="paths to files to corrupt. use - to corrupt\
+                        stdin to stdout")
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         multiplier = size_dict[args.unit]
     except KeyError:
-        print(f"[ERROR]: invalid unit '{args.unit}'")
-        exit(1)
+        common.print_error(f"invalid unit '{args.unit}'")
+        sys.exit(1)
 
     path_list = args.filepaths
+    rate = None if args.rate is None else args.rate / size_dict["MB"]
+
+    file_format = args.format
+    if file_format is None and (args.target or args.skip):
+        file_format = "auto"
 
-    # asks for a file if none provided
-    if path_list == []:
-        print("[NOTE]: no paths specified")
+    if args.seed is not None and args.fuzz is None:
+        random.seed(args.seed)
+
+    # the corrupted data goes to stdout when reading stdin, so messages have
+    # to go somewhere else
+    if "-" in path_list or (path_list == [] and not sys.stdin.isatty()):
+        common.reporter = common.Reporter(sys.stderr, json=args.json)
+    elif args.json:
+        common.reporter = common.Reporter(json=True)
+    # progress text would break up the json lines
+    verbose = args.verbose and not args.json
+    common.start_profiling(args)
+
+    # reads from stdin when piped into, otherwise asks for a file
+    if path_list == [] and not sys.stdin.isatty():
+        path_list.append("-")
+    elif path_list == []:
+        common.print_info("no paths specified")
+        common.reporter.flush()
         filepath = input("enter a file path> ")
         path_list.append(filepath)
 
     # corrupts all files in the list of files
     for filepath in path_list:
-        corrupt_file(args.corruptions, filepath, head=(args.head * multiplier),
-                     tail=(args.tail * multiplier), verbose=args.verbose)
+        if args.fuzz is not None:
+            try:
+                fuzz(args.corruptions, filepath, args.fuzz, jobs=args.jobs,
+                     iterations=args.iterations, timeout=args.timeout,
+                     crash_dir=args.crash_dir, crash_codes=args.crash_code,
+                     seed=args.seed, verbose=verbose,
+                     head=(args.head * multiplier),
+                     tail=(args.tail * multiplier), file_format=file_format,
+                     include=args.target, exclude=args.skip, mode=args.mode,
+                     length=args.length, rate=rate)
+            except ValueError as err:
+                common.print_error(f"{filepath}: {err}")
+                sys.exit(1)
+            continue
+
+        if filepath == "-":
+            # only a redirected file has a length known up front
+            stdin_stat = os.fstat(sys.stdin.fileno())
+            stdin_size = (stdin_stat.st_size
+                          if stat.S_ISREG(stdin_stat.st_mode) else None)
+            if stdin_size is None and args.rate is None:
+                common.print_error("stdin length unknown, use --rate to set\
+ the corruption density")
+                sys.exit(1)
+
+            eligible = None
+            if file_format and stdin_size is None:
+                # a pipe can't be parsed without reading all of it first
+                common.print_error("--format, --target and --skip need stdin\
+ to be a file, not a pipe")
+                sys.exit(1)
+            if file_format and stdin_size > 0:
+                with mmap.mmap(sys.stdin.fileno(), 0,
+                               access=mmap.ACCESS_READ) as data:
+                    eligible = _eligible_regions(
+                        data, stdin_size, args.head * multiplier,
+                        args.tail * multiplier, file_format=file_format,
+                        include=args.target, exclude=args.skip)
+            if file_format and not eligible:
+                common.print_error("stdin: no eligible regions to corrupt")
+                sys.exit(1)
+
+            try:
+                applied = corrupt_stream(
+                    args.corruptions, sys.stdin.buffer, sys.stdout.buffer,
+                    size=stdin_size, rate=rate, head=(args.head * multiplier),
+                    tail=(args.tail * multiplier), regions=eligible,
+                    mode=args.mode, length=args.length)
+            except ValueError as err:
+                common.print_error(f"stdin: {err}")
+                sys.exit(1)
+            common.reporter.record("corrupted", input="-", output="-",
+                                   size=stdin_size, corruptions=applied,
+                                   mode=args.mode)
+            continue
+
+        try:
+            corrupt_file(args.corruptions, filepath,
+                         head=(args.head * multiplier),
+                         tail=(args.tail * multiplier), verbose=verbose,
+                         stream=args.stream, file_format=file_format,
+                         include=args.target, exclude=args.skip,
+                         mode=args.mode, length=args.length, rate=rate)
+        except ValueError as err:
+            if verbose:
+                common.reporter.line("failed")
+            common.print_error(f"{filepath}: {err}")
+            sys.exit(1)
+
+    common.profiler.report()
+
+
+if __name__ == "__main__":
+    main()
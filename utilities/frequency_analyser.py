@@ -23,14 +23,15 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 SOFTWARE.
 """
 
-from copy import deepcopy
 import argparse
 import sys
 import re
-import itertools
-import json
-import math
-import common
+
+# works both as part of the bad_utilities package and as a script
+try:
+    from . import common
+except ImportError:
+    import common
 
 ideal_frequency = {
     'E': 0.1259063863781522,
@@ -99,6 +100,8 @@ def generate_tetragram_dict(alphabet: str =
                   that make up the tetragrams
     returns:
         tet_dict: dict of tetragrams"""
+    import itertools
+
     tet_dict: dict = {}
     alphabet = "".join(set(alphabet)).upper()
 
@@ -143,6 +146,7 @@ def frequency_counter(string: str, **kwargs) -> dict:
         ignore: bool; ignore capitalisation
         custom_charset: str; set of characters to count
         tgram: bool; whether to search for tetragrams
+        sort: bool; sort the result by frequency, defaults to True
     returns:
         letter_dict: dict; dictionary of characters and their freqiencies in
                     frequency order"""
@@ -199,13 +203,23 @@ def frequency_counter(string: str, **kwargs) -> dict:
             elif word and len(character) <= 45:
                 letter_dict.update({character: 1})
 
-    # sorting the dict to make the output more readable
-    letter_dict = dict(sorted(letter_dict.items(), key=lambda x: x[1],
-                       reverse=True))
+    if kwargs.get("sort", True):
+        letter_dict = sort_frequencies(letter_dict)
 
     return letter_dict
 
 
+def sort_frequencies(letter_dict: dict) -> dict:
+    """sorts a frequency dict, most frequent first
+    arguments:
+        letter_dict: dict; frequencies to sort
+    returns:
+        sorted_dict: dict; frequencies in frequency order"""
+    # sorting the dict to make the output more readable
+    return dict(sorted(letter_dict.items(), key=lambda x: x[1],
+                       reverse=True))
+
+
 def determine_correlation(std_letter_dict: dict) -> float:
     """determines if there is significant correlation with the
     distribution of characters in english and the given text sample
@@ -276,6 +290,8 @@ def automatic_key_map(freq_dict: dict) -> dict:
         mapped: dict; dict with the keys as the most common letters in the text
                 and values as the corresponding most common english letters
         """
+    from copy import deepcopy
+
     # checking the keys match
     if freq_dict.keys() != ideal_frequency.keys():
         return None
@@ -296,6 +312,8 @@ def automatic_key_map(freq_dict: dict) -> dict:
 
 def save_dict(sample_dict: dict, filename: str = "frequencies.json") -> None:
     """saves dict to json file"""
+    import json
+
     with open(filename, "w", encoding="utf-8") as json_file:
         json.dump(sample_dict, json_file, indent=4)
 
@@ -306,6 +324,8 @@ def normalise(freq_dict: dict) -> dict:
         freq_dict: dict; dict to normalise
     returns
         norm_dict: dict; normalised dict"""
+    from copy import deepcopy
+
     value_sum: int = sum(freq_dict.values())
 
     if value_sum == 0:
@@ -328,6 +348,9 @@ def take_log(freq_dict: dict, base: int = 10) -> dict:
         base: int; default 10; t
     returns
         log_dict: dict; logbased dict"""
+    import math
+    from copy import deepcopy
+
     log_dict = deepcopy(freq_dict)
 
     for key, value in log_dict.items():
@@ -352,14 +375,18 @@ def print_dict(sample_dict: dict, **kwargs) -> None:
         key, value = key_value
         if strip and value == 0:
             continue
-        print(f"{quote + key + quote:>{max_key_len}}: {value}")
+        common.reporter.line(f"{quote + key + quote:>{max_key_len}}: {value}")
 
 
-def main():
-    """main function"""
-    parser = argparse.ArgumentParser(description="prints out the frequency of\
-                                     characters in a given passage. default\
-                                     character set is uppercase latin letters")
+def main(argv: list = None, prog: str = None) -> None:
+    """main function
+    optional arguments:
+        argv: list; command line arguments, defaults to sys.argv
+        prog: str; program name to show in the help"""
+    parser = argparse.ArgumentParser(prog=prog, description="prints out the\
+                                     frequency of characters in a given\
+                                     passage. default character set is\
+                                     uppercase latin letters")
     parser.add_argument("file_path",
                         type=str,
                         metavar="file path",
@@ -468,8 +495,19 @@ letters, words, tetragrams)"
                         default=False,
                         help="remove spaces and punctuatuion from input texts"
                         )
+    parser.add_argument("--json",
+                        action="store_true",
+                        default=False,
+                        help="print one json object per section instead of \
+the readable tables"
+                        )
+    common.add_profile_arguments(parser)
+
+    args = parser.parse_args(argv)
 
-    args = parser.parse_args()
+    if args.json:
+        common.reporter = common.Reporter(json=True)
+    common.start_profiling(args)
 
     letter_sets = args.nth_letter
 
@@ -498,80 +536,112 @@ argument")
         common.print_error("no file specified")
         sys.exit(2)
 
-    content = get_file_content(file_path)
-    if args.upper:
-        content = content.upper()
-    if args.alphabetical:
-        content = re.sub("[^a-zA-Z ]", "", content)
+    with common.profiler.stage("read") as stage:
+        content = get_file_content(file_path)
+        stage.add(len(content))
 
-    content_list = []
-    n = letter_sets[0]
+    with common.profiler.stage("normalise", len(content)):
+        if args.upper:
+            content = content.upper()
+        if args.alphabetical:
+            content = re.sub("[^a-zA-Z ]", "", content)
 
-    if len(letter_sets) > 1:
-        if letter_sets[1] != 0 and letter_sets[1] is not None:
-            for i in range(n):
-                content_list.append(content[i::n])
-    else:
-        content_list.append(content[::n])
+        content_list = []
+        n = letter_sets[0]
+
+        if len(letter_sets) > 1:
+            if letter_sets[1] != 0 and letter_sets[1] is not None:
+                for i in range(n):
+                    content_list.append(content[i::n])
+        else:
+            content_list.append(content[::n])
 
-    print(f"frequencies in {args.file_path}:")
+    # json mode only builds the records, and text mode only the lines
+    json_mode = common.reporter.json
+    if not json_mode:
+        common.reporter.line(f"frequencies in {args.file_path}:")
 
     for index, content_string in enumerate(content_list):
-        if len(content_list) > 1:
-            print(f"\nsection {index+1}/{len(content_list)}:")
+        if len(content_list) > 1 and not json_mode:
+            common.reporter.line(f"\nsection {index+1}/{len(content_list)}:")
 
         # ======- running the frequency tests -======
 
-        frequency = frequency_counter(content_string,
-                                      ignore=(not args.ignore),
-                                      charset=args.custom,
-                                      tgram=args.tetragram,
-                                      word=args.word
-                                      )
-
-        r_value = determine_correlation(frequency)
-
-        # ========- various post-processing -========
-
-        # normalises the frequency
-        if args.normalise:
-            print_frequency = normalise(frequency)
-        elif args.log_base:
-            print_frequency = take_log(frequency)
-        else:
-            print_frequency = frequency
-
-        filename: str = args.save
-
-        if args.save:
-            if index > 1:
-                if filename.endswith(".json"):
-                    filename = filename.replace(".json", f"_{index}.json")
+        with common.profiler.stage("count", len(content_string)):
+            frequency = frequency_counter(content_string,
+                                          ignore=(not args.ignore),
+                                          charset=args.custom,
+                                          tgram=args.tetragram,
+                                          word=args.word,
+                                          sort=False
+                                          )
+        with common.profiler.stage("sort"):
+            frequency = sort_frequencies(frequency)
+
+        # post-processing, saving and printing
+        with common.profiler.stage("print"):
+            r_value = determine_correlation(frequency)
+
+            # ========- various post-processing -========
+
+            # normalises the frequency
+            if args.normalise:
+                print_frequency = normalise(frequency)
+            elif args.log_base:
+                print_frequency = take_log(frequency)
+            else:
+                print_frequency = frequency
+
+            record = {"file": file_path, "section": index + 1,
+                      "sections": len(content_list)}
+            filename: str = args.save
+
+            if args.save:
+                if index > 1:
+                    if filename.endswith(".json"):
+                        filename = filename.replace(".json", f"_{index}.json")
+                    else:
+                        filename += f"_{index}.json"
                 else:
-                    filename += f"_{index}.json"
+                    if not filename.endswith(".json"):
+                        filename += ".json"
+                if args.strip_zeros:
+                    print_frequency = {key: item for key, item in
+                                       print_frequency.items() if item != 0}
+                save_dict(print_frequency, filename)
+                record["saved"] = filename
+            elif json_mode:
+                record["frequencies"] = {key: item for key, item in
+                                         print_frequency.items()
+                                         if not args.strip_zeros or item != 0}
             else:
-                if not filename.endswith(".json"):
-                    filename += ".json"
-            if args.strip_zeros:
-                print_frequency = {key: item for key, item in
-                                   print_frequency.items() if item != 0}
-            save_dict(print_frequency, filename)
-        else:
-            print_dict(print_frequency, strip=args.strip_zeros)
-
-        if args.length:
-            print(sum(print_frequency.values()))
-
-        # printing pmcc compared to normal english
-        if args.correlation:
-            print(f"correlation value is: {r_value}")
-
-        # automatic mapping of the frequencies to english
-        if args.auto_map and not (args.tetragram or args.word):
-            auto_map = automatic_key_map(frequency)
-            print("auto mapping:")
-            print_dict(auto_map)
-            print(f"mapping as key:\n{''.join(auto_map.values())}")
+                print_dict(print_frequency, strip=args.strip_zeros)
+
+            if args.length:
+                record["length"] = sum(print_frequency.values())
+                if not json_mode:
+                    common.reporter.line(str(record["length"]))
+
+            # printing pmcc compared to normal english
+            if args.correlation:
+                record["correlation"] = r_value
+                if not json_mode:
+                    common.reporter.line(f"correlation value is: {r_value}")
+
+            # automatic mapping of the frequencies to english
+            if args.auto_map and not (args.tetragram or args.word):
+                auto_map = automatic_key_map(frequency)
+                record["auto_map"] = auto_map
+                if not json_mode:
+                    common.reporter.line("auto mapping:")
+                    print_dict(auto_map)
+                    common.reporter.line(
+                        f"mapping as key:\n{''.join(auto_map.values())}")
+
+            if json_mode:
+                common.reporter.record("frequencies", **record)
+
+    common.profiler.report()
 
 
 if __name__ == "__main__":
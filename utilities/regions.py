@@ -0,0 +1,326 @@
+"""regions - finds the byte ranges that make up container formats, so
+corruptions can be aimed at (or away from) specific chunks
+
+Copyright 2023 Frank Yelland
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the “Software”), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in all
+copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+
+regions are (start, end, name) tuples with end exclusive. payload regions
+are named after their chunk type (e.g. 'IDAT', 'VP8L', 'scan', 'data'),
+structural regions get a suffix (e.g. 'IDAT/header', 'IDAT/crc').
+"""
+
+import bisect
+import fnmatch
+import itertools
+import random
+
+_jpeg_marker_names = {
+    0xC4: "DHT",
+    0xC8: "JPG",
+    0xCC: "DAC",
+    0xD8: "SOI",
+    0xD9: "EOI",
+    0xDA: "SOS",
+    0xDB: "DQT",
+    0xDD: "DRI",
+    0xFE: "COM",
+}
+
+
+def _png_regions(data) -> list:
+    """splits a png into its chunks
+    arguments:
+        data: bytes-like; file content
+    returns:
+        regions: list; (start, end, name) tuples"""
+    size = len(data)
+    regions = [(0, 8, "signature/header")]
+    pos = 8
+
+    while pos + 8 <= size:
+        length = int.from_bytes(data[pos:pos + 4], "big")
+        chunk_type = data[pos + 4:pos + 8].decode("latin-1")
+        data_end = min(pos + 8 + length, size)
+
+        regions.append((pos, pos + 8, f"{chunk_type}/header"))
+        regions.append((pos + 8, data_end, chunk_type))
+        regions.append((data_end, min(data_end + 4, size),
+                        f"{chunk_type}/crc"))
+
+        pos = data_end + 4
+        if chunk_type == "IEND":
+            break
+
+    return regions
+
+
+def _jpeg_regions(data) -> list:
+    """splits a jpeg into its marker segments and entropy coded scans
+    arguments:
+        data: bytes-like; file content
+    returns:
+        regions: list; (start, end, name) tuples"""
+    size = len(data)
+    regions = [(0, 2, "SOI/header")]
+    pos = 2
+
+    while pos + 2 <= size and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        # fill bytes before a marker
+        if marker == 0xFF:
+            pos += 1
+            continue
+
+        name = _jpeg_marker_name(marker)
+        # markers without a length field
+        if marker in (0x01, 0xD9) or 0xD0 <= marker <= 0xD7:
+            regions.append((pos, pos + 2, f"{name}/header"))
+            pos += 2
+            if marker == 0xD9:
+                break
+            continue
+
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        segment_end = min(pos + 2 + length, size)
+        regions.append((pos, min(pos + 4, size), f"{name}/header"))
+        regions.append((min(pos + 4, size), segment_end, name))
+        pos = segment_end
+
+        if marker != 0xDA:
+            continue
+
+        # entropy coded data runs until the next marker that isn't a
+        # stuffed 0xFF00 or a restart marker
+        scan_start = pos
+        while True:
+            pos = data.find(b"\xff", pos)
+            if pos == -1 or pos + 1 >= size:
+                pos = size
+                break
+            following = data[pos + 1]
+            if following == 0x00 or 0xD0 <= following <= 0xD7:
+                pos += 2
+                continue
+            break
+        regions.append((scan_start, pos, "scan"))
+
+    return regions
+
+
+def _jpeg_marker_name(marker: int) -> str:
+    """gets the readable name of a jpeg marker
+    arguments:
+        marker: int; byte following the 0xFF
+    returns:
+        name: str; marker name"""
+    if marker in _jpeg_marker_names:
+        return _jpeg_marker_names[marker]
+    if 0xC0 <= marker <= 0xCF:
+        return f"SOF{marker - 0xC0}"
+    if 0xD0 <= marker <= 0xD7:
+        return f"RST{marker - 0xD0}"
+    if 0xE0 <= marker <= 0xEF:
+        return f"APP{marker - 0xE0}"
+    return f"FF{marker:02X}"
+
+
+def _riff_regions(data) -> list:
+    """splits a riff file (webp, wav, avi) into its top level chunks
+    arguments:
+        data: bytes-like; file content
+    returns:
+        regions: list; (start, end, name) tuples"""
+    size = len(data)
+    riff_end = min(8 + int.from_bytes(data[4:8], "little"), size)
+    regions = [(0, 12, "RIFF/header")]
+    pos = 12
+
+    while pos + 8 <= riff_end:
+        fourcc = data[pos:pos + 4].decode("latin-1").strip()
+        length = int.from_bytes(data[pos + 4:pos + 8], "little")
+        data_end = min(pos + 8 + length, riff_end)
+
+        regions.append((pos, pos + 8, f"{fourcc}/header"))
+        regions.append((pos + 8, data_end, fourcc))
+        pos = data_end
+        # chunks are padded to an even length
+        if length % 2 and pos < riff_end:
+            regions.append((pos, pos + 1, f"{fourcc}/pad"))
+            pos += 1
+
+    return regions
+
+
+def _zip_regions(data) -> list:
+    """splits a zip file into its headers and member data, using the
+    central directory
+    arguments:
+        data: bytes-like; file content
+    returns:
+        regions: list; (start, end, name) tuples"""
+    size = len(data)
+    # the end of central directory record sits within the last 64KiB
+    eocd = data.rfind(b"PK\x05\x06", max(0, size - 65557))
+    if eocd == -1 or eocd + 22 > size:
+        return []
+
+    entries = int.from_bytes(data[eocd + 10:eocd + 12], "little")
+    cd_pos = int.from_bytes(data[eocd + 16:eocd + 20], "little")
+    comment_len = int.from_bytes(data[eocd + 20:eocd + 22], "little")
+    regions = []
+
+    for _ in range(entries):
+        if data[cd_pos:cd_pos + 4] != b"PK\x01\x02":
+            break
+        compressed = int.from_bytes(data[cd_pos + 20:cd_pos + 24], "little")
+        entry_len = 46 + sum(int.from_bytes(data[i:i + 2], "little")
+                             for i in range(cd_pos + 28, cd_pos + 34, 2))
+        local = int.from_bytes(data[cd_pos + 42:cd_pos + 46], "little")
+        regions.append((cd_pos, min(cd_pos + entry_len, size),
+                        "central/header"))
+        cd_pos += entry_len
+
+        if data[local:local + 4] != b"PK\x03\x04":
+            continue
+        local_len = 30 + sum(int.from_bytes(data[i:i + 2], "little")
+                             for i in range(local + 26, local + 30, 2))
+        data_start = min(local + local_len, size)
+        regions.append((local, data_start, "local/header"))
+        regions.append((data_start, min(data_start + compressed, size),
+                        "data"))
+
+    regions.append((eocd, eocd + 22, "eocd/header"))
+    regions.append((eocd + 22, min(eocd + 22 + comment_len, size), "comment"))
+    regions.sort()
+
+    return regions
+
+
+# format name: (magic bytes, parser)
+parsers = {
+    "png": (b"\x89PNG\r\n\x1a\n", _png_regions),
+    "jpeg": (b"\xff\xd8\xff", _jpeg_regions),
+    "riff": (b"RIFF", _riff_regions),
+    "zip": (b"PK\x03\x04", _zip_regions),
+}
+
+
+def register_parser(name: str, magic: bytes, parser) -> None:
+    """adds a parser for another format
+    arguments:
+        name: str; format name
+        magic: bytes; bytes the format starts with, used for detection
+        parser: function; takes the file content and returns a list of
+                (start, end, name) regions"""
+    parsers[name] = (magic, parser)
+
+
+def detect_format(data) -> str:
+    """detects the format of a file from its magic bytes
+    arguments:
+        data: bytes-like; file content
+    returns:
+        name: str | None; format name, or None if not recognised"""
+    for name, (magic, _) in parsers.items():
+        if data[:len(magic)] == magic:
+            return name
+    return None
+
+
+def build_index(data, file_format: str = "auto") -> list:
+    """parses the structure of a file once
+    arguments:
+        data: bytes-like; file content, an mmap works for large files
+    optional arguments:
+        file_format: str; format name, or 'auto' to detect it
+    returns:
+        regions: list; (start, end, name) tuples, empty if the format
+                 is not recognised"""
+    if file_format == "auto":
+        file_format = detect_format(data)
+    if file_format not in parsers:
+        return []
+    return [region for region in parsers[file_format][1](data)
+            if region[1] > region[0]]
+
+
+def select_regions(regions: list, **kwargs) -> list:
+    """filters regions down to the ones eligible for corruption
+    arguments:
+        regions: list; (start, end, name) tuples
+    kwargs:
+        include: list; glob patterns of region names to keep, defaults to
+                 payload regions only (names without a '/')
+        exclude: list; glob patterns of region names to drop
+        low: int; first offset that can be picked, for head protection
+        high: int; offset after the last one that can be picked, for tail
+              protection
+    returns:
+        selected: list; (start, end, name) tuples clipped to low and high"""
+    include = kwargs.get("include", None)
+    exclude = kwargs.get("exclude", None) or []
+    low = kwargs.get("low", 0)
+    high = kwargs.get("high", None)
+
+    selected = []
+    for start, end, name in regions:
+        if include:
+            if not any(fnmatch.fnmatchcase(name, pattern)
+                       for pattern in include):
+                continue
+        elif "/" in name:
+            continue
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in exclude):
+            continue
+
+        start = max(start, low)
+        if high is not None:
+            end = min(end, high)
+        if end > start:
+            selected.append((start, end, name))
+
+    return selected
+
+
+def sample_spans(regions: list, count: int, length: int = 1) -> list:
+    """picks random spans from regions, with the start weighted by region
+    length and the span cut short at the end of its region
+    arguments:
+        regions: list; (start, end, name) tuples
+        count: int; number of spans to pick
+    optional arguments:
+        length: int; length of each span
+    returns:
+        spans: list; (start, end) tuples, in the order they were drawn"""
+    if not regions:
+        return []
+
+    # cumulative lengths turn each pick into a single binary search
+    totals = list(itertools.accumulate(end - start
+                                       for start, end, _ in regions))
+    spans = []
+    for _ in range(count):
+        point = random.randrange(totals[-1])
+        index = bisect.bisect_right(totals, point)
+        region_start, region_end, _ = regions[index]
+        start = region_start + point - (totals[index - 1] if index else 0)
+        spans.append((start, min(start + length, region_end)))
+
+    return spans
@@ -26,123 +26,936 @@ SOFTWARE."""
 import os
 import re
 import sys
+import stat
+import time
+import argparse
+import functools
+import itertools
+import contextlib
 
+# works both as part of the bad_utilities package and as a script
 try:
-    from PIL import Image
-except ModuleNotFoundError:
-    print("PIL is not installed - you need to install PIL with \
-'pip install PIL'")
-    sys.exit(1)
+    from . import common
+except ImportError:
+    import common
 
-# code copied from stackoverflow
-# fixes cmd being a bitch about ansi colour codes
-if os.name == 'nt':
-    from ctypes import windll
-    kernel = windll.kernel32
-    kernel.SetConsoleMode(kernel.GetStdHandle(-11), 7)
+# PIL.Image, imported by _load_pil when there is something to convert, so
+# --help doesn't wait for it
+Image = None
 
+# output format: (file extension, PIL format name)
+output_formats = {
+    "png": (".png", "PNG"),
+    "tiff": (".tiff", "TIFF"),
+    "bmp": (".bmp", "BMP"),
+    "jpeg": (".jpg", "JPEG"),
+}
 
-# the starts of various error and warning messages
-ERROR_MSG = "\x1b[38;5;196m[ERROR]:"
-WARN_MSG = "\x1b[38;5;220m[WARNING]:"
-INFO_MSG = "\x1b[38;5;27m[INFO]:"
-INFO_IND = "\x1b[38;5;27m|___[INFO]:"
-END_MSG = "\x1b[0m"
 
+def main(argv: list = None, prog: str = None) -> None:
+    """main function
+    optional arguments:
+        argv: list; command line arguments, defaults to sys.argv
+        prog: str; program name to show in the help"""
+    parser = argparse.ArgumentParser(prog=prog, description="searches the\
+                                     current directory for webp files,\
+                                     converts them to pngs and deletes the\
+                                     webps")
+    parser.add_argument("roots",
+                        nargs="*",
+                        default=["./"],
+                        metavar="path",
+                        help="directories to search, defaults to the current\
+ directory"
+                        )
+    parser.add_argument("-e",
+                        "--extension",
+                        action="append",
+                        default=None,
+                        metavar=" ",
+                        help="file extension to convert, can be repeated.\
+ defaults to .webp"
+                        )
+    parser.add_argument("-j",
+                        "--jobs",
+                        action="store",
+                        type=int,
+                        default=1,
+                        metavar=" ",
+                        help="number of files to convert in parallel, 0 uses\
+ every cpu"
+                        )
+    parser.add_argument("-i",
+                        "--index",
+                        action="store",
+                        default=None,
+                        metavar=" ",
+                        help="index file remembering directories that had\
+ nothing left to convert, so later runs only search directories changed\
+ since then"
+                        )
+    parser.add_argument("-f",
+                        "--format",
+                        choices=output_formats.keys(),
+                        default="png",
+                        metavar=" ",
+                        help=f"output format. jpeg is lossy and drops\
+ transparency. options: {', '.join(output_formats)}"
+                        )
+    parser.add_argument("-c",
+                        "--compress-level",
+                        action="store",
+                        type=int,
+                        choices=range(10),
+                        default=None,
+                        metavar=" ",
+                        help="png zlib level from 0 (fastest, biggest) to 9\
+ (slowest, smallest). defaults to 6"
+                        )
+    parser.add_argument("-O",
+                        "--optimize",
+                        action="store_true",
+                        default=False,
+                        help="spend extra time making png and jpeg files\
+ smaller"
+                        )
+    parser.add_argument("-q",
+                        "--quality",
+                        action="store",
+                        type=int,
+                        default=90,
+                        metavar=" ",
+                        help="jpeg quality from 1 to 95"
+                        )
+    parser.add_argument("-m",
+                        "--memory",
+                        action="store",
+                        type=int,
+                        default=2048,
+                        metavar=" ",
+                        help="MiB of decoded images that parallel workers may\
+ hold at once. images bigger than this are converted on their own"
+                        )
+    parser.add_argument("-p",
+                        "--plan",
+                        action="store_true",
+                        default=False,
+                        help="change nothing, just count the files to convert\
+ and estimate how long it will take and how much space the output needs,\
+ from test conversions of a sample"
+                        )
+    parser.add_argument("--plan-sample",
+                        action="store",
+                        type=int,
+                        default=10,
+                        metavar=" ",
+                        help="number of files to test convert for --plan"
+                        )
+    parser.add_argument("--fast",
+                        action="store_true",
+                        default=False,
+                        help="favour conversion speed over file size, same as\
+ --compress-level 1 without --optimize"
+                        )
+    parser.add_argument("--json",
+                        action="store_true",
+                        default=False,
+                        help="print one json object per converted file, error\
+ and summary instead of readable messages"
+                        )
+    common.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.json:
+        common.reporter = common.Reporter(json=True)
+    common.start_profiling(args)
+    _load_pil()
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
 
-def main():
-    """main function"""
+    options = save_options(args.format, compress_level=args.compress_level,
+                           optimize=args.optimize, quality=args.quality,
+                           fast=args.fast)
+    convert = functools.partial(convert_file, options=options)
 
-    # one liner i found somewhere to get all the webp files
-    files = [os.path.join(dp, f) for dp, dn, filenames in os.walk("./") for
-             f in filenames if os.path.splitext(f)[1] == '.webp']
+    extensions = [ext if ext.startswith(".") else f".{ext}"
+                  for ext in (args.extension or [".webp"])]
 
-    num_format_len = max(len(str(len(files))), 1)
-    file_format_len = min(max([len(file) for file in files]), 40)
+    index = load_index(args.index, extensions) if args.index else None
+    visited: dict = {}
+    failed = set()
 
-    for file_num, file in enumerate(files):
+    # files are converted as the scanner finds them, so the total isn't
+    # known up front
+    targets = scan(args.roots, extensions, index=index, visited=visited)
+
+    if args.plan:
+        plan(targets, options, jobs, args.plan_sample)
+        common.profiler.report()
+        return
+
+    if jobs > 1:
+        import multiprocessing
+        import concurrent.futures
+
+        budget = (multiprocessing.Condition(),
+                  multiprocessing.Value("q", 0, lock=False),
+                  multiprocessing.Value("i", 0, lock=False),
+                  args.memory * 1048576)
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_worker,
+            initargs=(budget, common.profiler.enabled))
+        if common.profiler.enabled:
+            # the workers send their stage timings back with each result
+            results = _merge_profiles(_pool_results(
+                pool, targets, jobs,
+                functools.partial(_convert_and_profile, convert)))
+        else:
+            results = _pool_results(pool, targets, jobs, convert)
+    else:
+        pool = None
+        results = map(convert, targets)
+
+    common.reporter.progress("(0) converting...")
+    file_format_len = 0
+    start_time = time.perf_counter()
+    # bytes read and written by successful conversions
+    totals = [0, 0]
+    converted = 0
+    file_num = -1
+
+    for file_num, (file, file_new, error, sizes) in enumerate(results):
         # progress string
-        progress = f"\x1b[2K({file_num + 1:>{num_format_len}d}/{len(files)})"
-        # more human readable filename string
-        file_name = f"'{re.sub('^./', '', file)}'"
-
-        # making sure files in the trash aren't included lest error spam
-        # the leading quote and the os.path.split are to trim off garbage in
-        # the recycle bin file path
-        if "$RECYCLE.BIN" in file:
-            print(f"{progress} {INFO_MSG} skipping \
-'{os.path.split(file_name)[1]} - file is in the recycle bin\
-{END_MSG}")
-            continue
+        progress = f"({file_num + 1})"
+        # more human readable filename strings
+        file_name = f"'{_display_path(file)}'"
+        file_format_len = min(max(file_format_len, len(file_name)), 40)
+
+        if error is None:
+            converted += 1
+            totals[0] += sizes[0]
+            totals[1] += sizes[1]
+        else:
+            failed.add(os.path.abspath(os.path.dirname(file)))
 
-        # wrapped in a try block because every file operation
-        # fucks up at some point
+        if common.reporter.json:
+            if error is None:
+                common.reporter.record("converted", file=file,
+                                       output=file_new, size=sizes[0],
+                                       size_new=sizes[1])
+            else:
+                common.reporter.record("failed", file=file,
+                                       error=type(error).__name__,
+                                       message=str(error))
+        elif error is None:
+            file_new = f"'{_display_path(file_new)}'"
+            common.reporter.line(f"{progress} converted \
+{file_name:<{file_format_len}} -> {file_new}")
+        elif isinstance(error, FileNotFoundError):
+            common.reporter.error(f"{file_name} does not exist",
+                                  prefix=f"{progress} ")
+        elif isinstance(error, FileExistsError):
+            common.reporter.warning(f"{file_name} already exists",
+                                    prefix=f"{progress} ")
+        # other errors
+        else:
+            common.reporter.error(f"{file_name} not converted: {error}",
+                                  prefix=f"{progress} ")
+
+        common.reporter.progress(f"{progress} converting...")
+
+    if pool is not None:
+        pool.shutdown()
+    if args.index:
+        save_index(args.index, extensions, visited, failed)
+
+    elapsed = time.perf_counter() - start_time
+    common.reporter.record("summary", files=file_num + 1,
+                           converted=converted, size=totals[0],
+                           size_new=totals[1], seconds=round(elapsed, 3))
+    if totals[0] > 0 and not common.reporter.json:
+        common.print_info(f"{_format_size(totals[0])} -> \
+{_format_size(totals[1])} (size ratio {totals[1] / totals[0]:.2f}) at \
+{_format_size(totals[0] / elapsed)}/s")
+    common.profiler.report()
+    common.reporter.line("done.")
+
+
+def plan(targets, options: dict, jobs: int, sample_size: int) -> None:
+    """estimates the time and space a conversion will take without changing
+    anything. the targets are counted and a random sample is converted into
+    a temporary directory to measure the speed and size ratio
+    arguments:
+        targets: iterable; paths to the files that would be converted
+        options: dict; output settings from save_options
+        jobs: int; number of parallel workers to estimate for
+        sample_size: int; number of files to test convert"""
+    import random
+    import tempfile
+
+    _load_pil()
+    start_time = time.perf_counter()
+    count = 0
+    total_size = 0
+    sample: list = []
+
+    for file in targets:
         try:
-            print(f"{progress} converting {file_name}...", end="\r")
+            total_size += os.path.getsize(file)
+        except OSError:
+            continue
+        count += 1
+        # reservoir sampling, so the sample is spread over the whole scan
+        # without keeping every path
+        if len(sample) < sample_size:
+            sample.append(file)
+        else:
+            slot = random.randrange(count)
+            if slot < sample_size:
+                sample[slot] = file
+        if count % 1000 == 0:
+            common.reporter.progress(f"({count}) scanning...")
+
+    scan_time = time.perf_counter() - start_time
+    if count == 0:
+        common.reporter.record("plan", files=0, size=0,
+                               scan_seconds=round(scan_time, 3))
+    if not common.reporter.json:
+        common.print_info(f"{count} files, {_format_size(total_size)}, found \
+in {scan_time:.1f}s")
+    if count == 0:
+        return
+
+    sampled = 0
+    sample_in = 0
+    sample_out = 0
+    sample_time = 0.0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file in sample:
+            try:
+                with open(os.path.join(temp_dir, "sample"), "wb") as out_file:
+                    encode_start = time.perf_counter()
+                    size_new = encode_image(file, out_file, options)
+                    sample_time += time.perf_counter() - encode_start
+                sample_in += os.path.getsize(file)
+                sample_out += size_new
+                sampled += 1
+            except (OSError, Image.DecompressionBombError) as err:
+                common.print_warning(f"test conversion of {file} failed: \
+{err}")
+
+    if sample_in == 0 or sample_time == 0:
+        common.print_error("no test conversions succeeded, cannot estimate")
+        # what was found is still worth having without the estimates
+        common.reporter.record("plan", files=count, size=total_size,
+                               scan_seconds=round(scan_time, 3), sampled=0)
+        return
+
+    # assuming every worker converts as fast as the single test process,
+    # plus searching the tree again, which a real run does as it goes
+    rate = sample_in / sample_time
+    ratio = sample_out / sample_in
+    estimate = scan_time + total_size / (rate * jobs)
+    if common.reporter.json:
+        common.reporter.record("plan", files=count, size=total_size,
+                               scan_seconds=round(scan_time, 3),
+                               sampled=sampled, rate=round(rate),
+                               size_ratio=ratio, jobs=jobs,
+                               seconds=round(estimate, 3),
+                               size_new=round(total_size * ratio))
+        return
+    common.print_info(f"sampled {sampled} files: {_format_size(rate)}/s \
+per worker, size ratio {ratio:.2f}",
+                      f"estimated time with {jobs} jobs, including the \
+search: {_format_duration(estimate)}",
+                      f"estimated output size: \
+{_format_size(total_size * ratio)} (disk use changes by \
+{_format_size(total_size * (ratio - 1))})")
+
+
+def _format_duration(seconds: float) -> str:
+    """formats a number of seconds as hours, minutes and seconds
+    arguments:
+        seconds: float; duration
+    returns:
+        duration: str; e.g. '1h 02m 03s'"""
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {seconds:02d}s"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+def save_options(output_format: str, **kwargs) -> dict:
+    """works out the output settings for convert_file
+    arguments:
+        output_format: str; key of output_formats
+    kwargs:
+        compress_level: int | None; png zlib level, None for PIL's default
+        optimize: bool; make png and jpeg files smaller at the cost of time
+        quality: int; jpeg quality
+        fast: bool; use the fastest png settings
+    returns:
+        options: dict; output format and keyword arguments for Image.save"""
+    compress_level = kwargs.get("compress_level", None)
+    optimize = kwargs.get("optimize", False)
+    if kwargs.get("fast", False):
+        compress_level = 1
+        optimize = False
 
-            image = Image.open(file)
-            filename_new = file.replace(".webp", ".png")
-            # more human readable new filename string
-            file_new = f"'{re.sub('^./', '', filename_new)}'"
+    save_kwargs: dict = {}
+    if output_format == "png":
+        if compress_level is not None:
+            save_kwargs["compress_level"] = compress_level
+        save_kwargs["optimize"] = optimize
+    elif output_format == "jpeg":
+        save_kwargs["quality"] = kwargs.get("quality", 90)
+        save_kwargs["optimize"] = optimize
+    elif output_format == "tiff":
+        # deflate keeps tiffs lossless without being enormous
+        save_kwargs["compression"] = "tiff_deflate"
 
-            # adding "_<number>" in order to
-            # not overwrite other files
-            filename_new = check_filename(filename_new)
+    return {"format": output_format, "save_kwargs": save_kwargs}
 
-            image.save(filename_new, "png")
-            image.close()
 
-            # removing webp
+def _format_size(size: float) -> str:
+    """formats a number of bytes with a binary unit
+    arguments:
+        size: float; number of bytes
+    returns:
+        size_string: str; e.g. '12.3 MiB'"""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+
+def _display_path(path: str) -> str:
+    """strips a leading './' from a path for more readable output
+    arguments:
+        path: str; path to tidy
+    returns:
+        display_path: str; path without the leading './'"""
+    return re.sub(r"^\./", "", path)
+
+
+def scan(roots: list, extensions: list, exclude: tuple = ("$RECYCLE.BIN",),
+         **kwargs):
+    """walks directory trees with os.scandir, yielding matching files as they
+    are found. excluded directories are never descended into
+    arguments:
+        roots: list; directories to search
+        extensions: list; file extensions to yield, case insensitive
+    optional arguments:
+        exclude: tuple; names of directories to skip
+    kwargs:
+        index: dict | None; directories from the last run, from load_index.
+               directories with an unchanged mtime are not listed again
+        visited: dict | None; filled with the state of every directory
+                 visited, for save_index
+    yields:
+        path: str; path to a matching file"""
+    extensions = tuple(ext.lower() for ext in extensions)
+    index = kwargs.get("index", None) or {}
+    visited = kwargs.get("visited", None)
+    if visited is None:
+        visited = {}
+    # depth first, so memory only grows with the depth of the tree
+    stack = list(reversed(roots))
+
+    while stack:
+        directory = stack.pop()
+        key = os.path.abspath(directory)
+        # timed per directory, as the time between yields is spent
+        # converting
+        with common.profiler.stage("scan"):
+            try:
+                # taken before listing, so anything added while listing
+                # makes the directory look changed next time
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError as err:
+                common.print_warning(f"cannot search {directory}: \
+{err.strerror}")
+                continue
+
+            # a directory's mtime only changes when entries are added,
+            # removed or renamed, so an unchanged one has nothing new to
+            # convert
+            cached = index.get(key)
+            if cached is not None and cached["mtime"] == mtime:
+                visited[key] = cached
+                stack.extend(os.path.join(directory, name) for name in
+                             reversed(cached["subdirs"])
+                             if name not in exclude)
+                continue
+
+            try:
+                subdirs, matches = _list_directory(directory, extensions)
+            except OSError as err:
+                common.print_warning(f"cannot search {directory}: \
+{err.strerror}")
+                continue
+
+        visited[key] = {"mtime": mtime, "subdirs": subdirs,
+                        "converted": bool(matches)}
+
+        # the directory is closed before yielding as the files in it are
+        # about to be converted
+        yield from matches
+
+        for name in reversed(subdirs):
+            # making sure the trash isn't included lest error spam
+            if name in exclude:
+                common.print_info(f"skipping \
+'{_display_path(os.path.join(directory, name))}' - excluded directory")
+                continue
+            stack.append(os.path.join(directory, name))
+
+
+def _list_directory(directory: str, extensions: tuple) -> tuple:
+    """lists a single directory
+    arguments:
+        directory: str; directory to list
+        extensions: tuple; lowercase file extensions to match
+    returns:
+        subdirs: list; names of the subdirectories
+        matches: list; paths of the files with a matching extension"""
+    subdirs = []
+    matches = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.name.lower().endswith(extensions) \
+                        and entry.is_file():
+                    matches.append(entry.path)
+            except OSError:
+                continue
+    return subdirs, matches
+
+
+def load_index(index_path: str, extensions: list) -> dict:
+    """loads the directory index written by the last run
+    arguments:
+        index_path: str; path to the index file
+        extensions: list; extensions being searched for. the index is only
+                    valid for the extensions it was made with
+    returns:
+        index: dict; absolute directory paths and their state"""
+    import json
+
+    try:
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as err:
+        common.print_warning(f"cannot read index {index_path}, searching \
+everything: {err}")
+        return {}
+
+    if index.get("version") != 1 or \
+            sorted(index.get("extensions", [])) != sorted(extensions):
+        return {}
+    return index.get("dirs", {})
+
+
+def save_index(index_path: str, extensions: list, visited: dict,
+               failed: set) -> None:
+    """writes the directory index for the next run
+    arguments:
+        index_path: str; path to the index file
+        extensions: list; extensions that were searched for
+        visited: dict; directory states filled in by scan
+        failed: set; absolute paths of directories with files that failed
+                to convert, these are searched again next run"""
+    import json
+
+    # mtimes too close to now could hide a change made within the same
+    # timestamp tick, so those directories get searched once more
+    cutoff = time.time_ns() - 2000000000
+    lowered = tuple(ext.lower() for ext in extensions)
+    dirs = {}
+
+    for key, state in visited.items():
+        if key in failed:
+            continue
+        if state.get("converted"):
+            # converting changed the directory, so it's listed again to
+            # check nothing else turned up while it was being converted.
+            # the mtime is taken before listing, as in scan
+            try:
+                mtime = os.stat(key).st_mtime_ns
+                subdirs, matches = _list_directory(key, lowered)
+            except OSError:
+                continue
+            if matches:
+                continue
+            state = {"mtime": mtime, "subdirs": subdirs, "converted": False}
+        if state["mtime"] >= cutoff:
+            continue
+        dirs[key] = state
+
+    try:
+        with open(index_path, "w", encoding="utf-8") as index_file:
+            json.dump({"version": 1, "extensions": sorted(extensions),
+                       "dirs": dirs}, index_file)
+    except OSError as err:
+        common.print_warning(f"cannot write index {index_path}: {err}")
+
+
+def convert_file(file: str, options: dict = None) -> tuple:
+    """converts a single image file and removes the original. runs in the
+    worker processes when converting in parallel.
+    the new file is written to a hidden temporary file next to it, synced,
+    then moved into place, and the original is only removed after that, so
+    an interrupted run never leaves a truncated file behind
+    arguments:
+        file: str; path to webp file
+    optional arguments:
+        options: dict; output settings from save_options, defaults to png
+                 with PIL's default settings
+    returns:
+        file: str; path to webp file
+        filename_new: str | None; path to the new file
+        error: Exception | None; error that stopped the conversion
+        sizes: tuple | None; sizes of the original and new files in bytes"""
+    import tempfile
+
+    # workers started with spawn instead of fork import PIL here
+    _load_pil()
+    if options is None:
+        options = save_options("png")
+    extension = output_formats[options["format"]][0]
+    temp_path = None
+
+    # wrapped in a try block because every file operation
+    # fucks up at some point
+    try:
+        file_stat = os.stat(file)
+        size = file_stat.st_size
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file) or ".",
+                                         prefix=".", suffix=".tmp")
+        # temporary files are private, the new file gets the same
+        # permissions as the original instead
+        os.chmod(temp_path, stat.S_IMODE(file_stat.st_mode))
+        with os.fdopen(fd, "wb") as temp_file:
+            size_new = encode_image(file, temp_file, options)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+
+        # adding " <number>" in order to
+        # not overwrite other files
+        filename_new = reserve_filename(
+            f"{os.path.splitext(file)[0]}{extension}",
+            claim=functools.partial(_move_exclusive, temp_path))
+        temp_path = None
+        _sync_directory(os.path.dirname(filename_new))
+
+        # removing webp
+        with common.profiler.stage("remove", size):
             os.remove(file)
+    except (OSError, Image.DecompressionBombError) as err:
+        return file, None, err, None
+    finally:
+        # not leaving half written files behind
+        if temp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
 
-            # clearing line and printing progress
-            print(f"{progress} converted {file_name:<{file_format_len}}\
- -> {file_new}")
+    return file, filename_new, None, (size, size_new)
 
-        except FileNotFoundError:
-            print(f"{progress} {ERROR_MSG} {file_name} does not exist \
-{END_MSG}")
-        except FileExistsError:
-            print(f"{progress} {WARN_MSG} {file_name} already exists\
-{END_MSG}")
-        # other errors
-        except OSError as err:
-            print(f"{progress} {ERROR_MSG} {file_name} not converted: {err}\
-{END_MSG}")
-    print("done.")
+
+def encode_image(file: str, out_file, options: dict) -> int:
+    """decodes an image and writes it out in the output format
+    arguments:
+        file: str; path to the image
+        out_file: binary file object to write to
+        options: dict; output settings from save_options
+    returns:
+        size_new: int; number of bytes written"""
+    _load_pil()
+    pil_format = output_formats[options["format"]][1]
+    start = out_file.tell()
+
+    # opening only reads the header, so the pixels aren't held until the
+    # budget allows it
+    with Image.open(file) as image, \
+            _memory_budget(image.width * image.height *
+                           len(image.getbands())):
+        with common.profiler.stage("decode",
+                                   image.width * image.height *
+                                   len(image.getbands())):
+            image.load()
+        with common.profiler.stage("encode") as stage:
+            if pil_format == "JPEG" and \
+                    image.mode not in ("RGB", "L", "CMYK"):
+                image = image.convert("RGB")
+            image.save(out_file, pil_format, **options["save_kwargs"])
+            stage.add(out_file.tell() - start)
+
+    return out_file.tell() - start
 
 
-def check_filename(filename: str) -> str:
-    """appends '_<number>' to the end of the filename
-    if the file already exists
-    note: this function only checks the directory it is run in.
+def _load_pil() -> None:
+    """imports PIL.Image into the module the first time it is needed"""
+    global Image
+    if Image is not None:
+        return
+    try:
+        from PIL import Image as pil_image
+    except ModuleNotFoundError:
+        common.print_error("PIL is not installed - you need to install PIL \
+with 'pip install PIL'")
+        sys.exit(1)
+    Image = pil_image
+
+
+# (condition, shared bytes in use, oversize images waiting, limit) for the
+# memory budget shared by the worker processes, None when converting
+# sequentially
+_budget = None
+
+
+def _init_worker(budget: tuple, profile: bool = False) -> None:
+    """stores the shared memory budget in a worker process, and gives it its
+    own profiler so a forked copy of the main one isn't reused"""
+    global _budget
+    _budget = budget
+    common.profiler = common.Profiler(enabled=profile)
+
+
+def _convert_and_profile(convert, file: str) -> tuple:
+    """converts a file in a worker and hands back the stages it timed
     arguments:
-        filename: str; file name
+        convert: function; conversion function, see _pool_results
+        file: str; path to webp file
     returns:
-        filename: str; file name but with _<number> on the end"""
-    first_run_flag = True
-    counter = 1
-    while os.path.isfile(filename):
-        counter += 1
-        if first_run_flag:
-            # padding allows for a different message if the same
-            # filename is present several times
-            print(f"{INFO_MSG} {filename} exists {END_MSG}")
-            filename = re.sub(".png",
-                              f" {counter}.png",
-                              filename)
+        result: tuple; result of convert_file
+        stages: dict; stages from Profiler.collect"""
+    result = convert(file)
+    return result, common.profiler.collect()
+
+
+def _merge_profiles(results):
+    """adds the stage timings sent back by the workers to the main profiler
+    arguments:
+        results: iterable; (result, stages) tuples from _convert_and_profile
+    yields:
+        result: tuple; result of convert_file"""
+    for result in results:
+        # a worker that died only sends back the error
+        if len(result) == 2:
+            common.profiler.merge(result[1])
+            result = result[0]
+        yield result
+
+
+@contextlib.contextmanager
+def _memory_budget(cost: int):
+    """waits until cost bytes fit in the memory budget shared by the
+    workers, and holds them until the block ends. anything bigger than the
+    whole budget waits until it can run alone, and nothing new starts while
+    it waits so it isn't starved by smaller images
+    arguments:
+        cost: int; estimated bytes needed"""
+    if _budget is None:
+        yield
+        return
+
+    condition, used, waiting, limit = _budget
+    cost = min(cost, limit)
+    with condition:
+        if cost == limit:
+            waiting.value += 1
+            while used.value > 0:
+                condition.wait()
+            waiting.value -= 1
         else:
-            # padding allows for a different message if the same
-            # filename is present several times
-            print(f"{INFO_IND} {filename} also exists {END_MSG}")
-            filename = re.sub(" [0-9].png",
-                              f" {counter}.png",
-                              filename)
-        first_run_flag = False
+            while waiting.value > 0 or \
+                    (used.value > 0 and used.value + cost > limit):
+                condition.wait()
+        used.value += cost
+    try:
+        yield
+    finally:
+        with condition:
+            used.value -= cost
+            condition.notify_all()
+
+
+def _move_exclusive(source: str, destination: str) -> None:
+    """moves a file into place in a single step, raising FileExistsError
+    instead of replacing an existing file
+    arguments:
+        source: str; path to the file
+        destination: str; path to move it to"""
+    # rename refuses to replace files on windows
+    if os.name == "nt":
+        os.rename(source, destination)
+        return
+
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        raise
+    # filesystems without hard links
+    except OSError:
+        _create_exclusive(destination)
+        os.replace(source, destination)
+        return
+    os.remove(source)
+
+
+def _sync_directory(directory: str) -> None:
+    """flushes a directory entry to disk so a rename survives a crash. only
+    possible on posix, and a best effort there
+    arguments:
+        directory: str; directory to sync"""
+    if os.name == "nt":
+        return
+    with contextlib.suppress(OSError):
+        fd = os.open(directory or ".", os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def _pool_results(pool, targets, jobs: int, convert=convert_file):
+    """submits files to a process pool as they are found and yields their
+    results in the order they finish
+    arguments:
+        pool: concurrent.futures.Executor; pool to convert with
+        targets: iterable; paths to webp files
+        jobs: int; number of workers in the pool
+    optional arguments:
+        convert: function; conversion function, convert_file with its
+                 options filled in
+    yields:
+        result: tuple; result of convert_file"""
+    import concurrent.futures
+
+    targets = iter(targets)
+    pending: dict = {}
+
+    while True:
+        # a couple of files queued per worker keeps them busy without
+        # pulling the whole scan into memory
+        try:
+            for file in itertools.islice(targets, jobs * 2 - len(pending)):
+                pending[pool.submit(convert, file)] = file
+        # a worker died, e.g. killed for running out of memory, and the
+        # pool can't take any more work. the rest of the files are failed
+        # so the run still finishes and saves its index
+        except concurrent.futures.BrokenExecutor as err:
+            for file in itertools.chain((file,), targets):
+                yield file, None, err, None
+        if not pending:
+            break
+
+        done, _ = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            file = pending.pop(future)
+            try:
+                yield future.result()
+            # errors that aren't file errors, e.g. a worker dying, still
+            # only affect their own file
+            except Exception as err:
+                yield file, None, err, None
+
+
+def reserve_filename(filename: str, claim=None) -> str:
+    """picks a name that doesn't exist yet by adding ' <number>' before the
+    extension, and claims it so no other worker can pick it too. each
+    directory is listed once and the highest number used for every name is
+    remembered, so a collision costs a dict lookup rather than a stat per
+    existing copy
+    arguments:
+        filename: str; wanted file name
+    optional arguments:
+        claim: function; takes a path and creates it, raising
+               FileExistsError if it already exists. defaults to creating
+               an empty file with O_EXCL
+    returns:
+        filename: str; claimed file name, with ' <number>' added if the
+                  wanted name was taken"""
+    if claim is None:
+        claim = _create_exclusive
+    directory, base = os.path.split(filename)
+    stem, extension = os.path.splitext(base)
+    names, counters = _directory_counters(directory)
+    key = os.path.normcase(base)
+
+    # the bare name is used whenever it's free, even if numbered copies of
+    # it are left over
+    counter = counters.get(key, 1) if key in names else 0
+    while True:
+        counter += 1
+        candidate = os.path.join(directory, base if counter == 1 else
+                                 f"{stem} {counter}{extension}")
+        try:
+            claim(candidate)
+        # the listing is out of date, most likely another worker got there
+        # first, so the next number is tried
+        except FileExistsError:
+            counter = max(counter, counters.get(key, 1))
+            continue
+        names.add(key)
+        counters[key] = max(counters.get(key, 1), counter)
+        return candidate
+
+
+# listings are cached per process, the oldest ones are dropped once there
+# are this many as the scanner finishes with directories in order
+_MAX_CACHED_DIRECTORIES = 256
+_directory_cache: dict = {}
+# matches 'name <number>.ext'
+_NUMBERED_NAME = re.compile(r"(.*) ([0-9]+)(\.[^.]*)?")
 
-    return filename
+
+def _directory_counters(directory: str) -> tuple:
+    """lists a directory once, keeping the names in it and the highest
+    ' <number>' used for every name
+    arguments:
+        directory: str; directory to list
+    returns:
+        names: set; normcased names in the directory
+        counters: dict; normcased names with numbered copies and their
+                  highest number. a name can have numbered copies without
+                  existing itself"""
+    if directory in _directory_cache:
+        return _directory_cache[directory]
+
+    names = set()
+    counters: dict = {}
+    for name in os.listdir(directory or "."):
+        name = os.path.normcase(name)
+        names.add(name)
+        match = _NUMBERED_NAME.fullmatch(name)
+        if match is not None:
+            key = f"{match[1]}{match[3] or ''}"
+            counters[key] = max(counters.get(key, 1), int(match[2]))
+
+    if len(_directory_cache) >= _MAX_CACHED_DIRECTORIES:
+        del _directory_cache[next(iter(_directory_cache))]
+    _directory_cache[directory] = (names, counters)
+    return names, counters
+
+
+def _create_exclusive(path: str) -> None:
+    """creates an empty file, raising FileExistsError if it already exists
+    arguments:
+        path: str; path to the file"""
+    os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
 
 
 if __name__ == "__main__":
     main()
-    input("press enter to continue...")
+    # keeps the window open when double clicked, without blocking scripts
+    if sys.stdin.isatty():
+        common.reporter.flush()
+        input("press enter to continue...")